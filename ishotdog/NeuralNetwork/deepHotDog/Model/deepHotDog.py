@@ -23,18 +23,32 @@
 import tensorflow as tf
 import tensorflow.keras.layers as layers
 
+# width scales the filters and the dense units, depthwise makes the second
+# and third convolutions depthwise separable, global_pool averages the last
+# feature map instead of flattening it (the flattened 26x26x64 map holds
+# most of the weights) and resolution is the side of the input images.
+# The defaults are the original network.
 class DeepHotDog(tf.keras.Model):
-    def __init__(self):
+    def __init__(self, width=1.0, depthwise=False, global_pool=False, resolution=224):
         super(DeepHotDog, self).__init__()
-        self.down1 = layers.Conv2D(8, kernel_size=3, activation='relu', name="Conv1")
+        self.resolution = resolution
+        def filters(n):
+            return max(1, int(round(n * width)))
+        conv = layers.SeparableConv2D if depthwise else layers.Conv2D
+        self.down1 = layers.Conv2D(filters(8), kernel_size=3, activation='relu', name="Conv1")
         self.pool1 = layers.MaxPooling2D(pool_size=(2, 2), name="Pooling1")
-        self.down2 = layers.Conv2D(24, kernel_size=3, activation='relu', name="Conv2")
+        self.down2 = conv(filters(24), kernel_size=3, activation='relu', name="Conv2")
         self.pool2 = layers.MaxPooling2D(pool_size=(2, 2), name="Pooling2")
-        self.down3 = layers.Conv2D(64, kernel_size=3, activation='relu', name="Conv3")
+        self.down3 = conv(filters(64), kernel_size=3, activation='relu', name="Conv3")
         self.pool3 = layers.MaxPooling2D(pool_size=(2, 2), name="Pooling3")
-        self.flatten = layers.Flatten()
-        self.dense1 = layers.Dense(64, activation='relu', name="Dense1")
-        self.dense2 = layers.Dense(1, activation='sigmoid', name="Dense2")
+        if global_pool:
+            self.flatten = layers.GlobalAveragePooling2D(name="GlobalPool")
+        else:
+            self.flatten = layers.Flatten()
+        self.dense1 = layers.Dense(filters(64), activation='relu', name="Dense1")
+        # Kept in float32 under mixed precision, so the sigmoid and the loss
+        # do not lose precision
+        self.dense2 = layers.Dense(1, activation='sigmoid', dtype='float32', name="Dense2")
     
     def call(self, x):
         x = self.down1(x)
@@ -46,4 +60,4 @@ class DeepHotDog(tf.keras.Model):
         x = self.flatten(x)
         x = self.dense1(x)
         x = self.dense2(x)
-        return x
\ No newline at end of file
+        return x
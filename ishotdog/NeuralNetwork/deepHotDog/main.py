@@ -22,12 +22,20 @@
 # SOFTWARE.
 
 import argparse
+import collections
+import concurrent.futures
+import csv
 import datetime
-from matplotlib import pyplot
+import hashlib
+import json
+import multiprocessing
 from Model import deepHotDog
+import mosaic
 import numpy as np
 import os
+import queue
 import random
+import tempfile
 import sklearn.model_selection as ms
 import tensorflow as tf
 import time
@@ -41,6 +49,68 @@ EPOCHS = 5
 CLASS_0 = "hotdog"
 CLASS_1 = "office"
 
+# Input pipeline: parallel decode calls, cache of the decoded images ("" in
+# memory, a path prefix on disk, None no cache) and batches prefetched
+PARALLEL_CALLS = tf.data.experimental.AUTOTUNE
+CACHE = None
+PREFETCH = tf.data.experimental.AUTOTUNE
+SHUFFLE_BUFFER = 1000
+
+# Preprocessed dataset: TFRecord shards of SHARD_SIZE images and a manifest
+RECORDS_PATH = "records"
+RECORDS_MANIFEST = "manifest.json"
+SHARD_SIZE = 1000
+RECORD_FEATURES = {"image": tf.io.FixedLenFeature([], tf.string),
+                   "label": tf.io.FixedLenFeature([], tf.int64)}
+
+# Models evaluated by -e when none are given and runs before timing
+EVAL_MODELS = ["converted_model.tflite", "converted_model_quantized.tflite"]
+EVAL_WARMUP = 5
+
+# Training modes compared by -m, (precision, jit_compile), on a fixed
+# synthetic dataset of BENCH_IMAGES images
+TRAIN_MODES = [("float32", False), ("float32", True), ("bfloat16", False), ("bfloat16", True)]
+BENCH_IMAGES = 200
+BENCH_EPOCHS = 3
+
+# tflite variants made by -c, cached by the hash of the SavedModel. The
+# representative set of int8 is a stratified sample stored until the images
+# or the input shape change.
+CONVERT_VARIANTS = {"float32": "converted_model.tflite",
+                    "float16": "converted_model_fp16.tflite",
+                    "dynamic": "converted_model_dynamic.tflite",
+                    "int8": "converted_model_quantized.tflite"}
+CONVERT_MANIFEST = "converted_manifest.json"
+CONVERT_RUNS = 20
+REPRESENTATIVE_FILE = "representative.npz"
+REPRESENTATIVE_SIZE = 100
+SAVED_MODEL_PATH = os.path.join("model", "1")
+
+# Architectures trained by -s for SWEEP_EPOCHS, converted to SWEEP_VARIANT
+# and timed on the host
+SWEEP_ARCHS = [{},
+               {"width": 0.5},
+               {"global_pool": True},
+               {"depthwise": True},
+               {"depthwise": True, "global_pool": True},
+               {"width": 0.5, "depthwise": True, "global_pool": True},
+               {"global_pool": True, "resolution": 160},
+               {"width": 0.5, "depthwise": True, "global_pool": True, "resolution": 128}]
+SWEEP_EPOCHS = 2
+SWEEP_VARIANT = "dynamic"
+SWEEP_FILE = "sweep.json"
+
+# Validation images drawn by -i and where the activations and filters go
+INSPECT_IMAGES = 32
+INSPECT_PATH = "inspect"
+
+# Inference of -r: images found in the folders, batch size, output and
+# seconds between throughput reports
+INFER_EXTENSIONS = (".jpg", ".jpeg")
+INFER_BATCH = 32
+INFER_OUTPUT = "predictions.csv"
+INFER_REPORT = 10.0
+
 CHECKPOINT_PATH = os.path.join("checkpoint","cp.ckpt")
 LOG_PATH = os.path.join("log","fit",datetime.datetime.now().strftime("%Y%m%d-%H%M%S"))
 
@@ -48,19 +118,82 @@ def parse_arguments():
     parser = argparse.ArgumentParser(description="deepHotDog")
     parser.add_argument('-t', help="Train Model", action='store_true')
     parser.add_argument('-e', help="Eval Model", action='store_true')
-    parser.add_argument('-i', help="Show intermediate layers", action='store_true')
+    parser.add_argument('-i', help="Show intermediate layers and filters", action='store_true')
     parser.add_argument('-f', help="Folder with folders")
     parser.add_argument('-c', help="Convert Model to tflite", action='store_true')
+    parser.add_argument('-b', help="Benchmark the input pipeline", action='store_true')
+    parser.add_argument('-m', help="Benchmark the training modes", action='store_true')
+    parser.add_argument('-s', help="Sweep the architectures of SWEEP_ARCHS", action='store_true')
+    parser.add_argument('-p', help="Preprocess the dataset into TFRecord shards", action='store_true')
+    parser.add_argument('--records', default=RECORDS_PATH, help="Output folder of -p")
+    parser.add_argument('--inspect', type=int, default=INSPECT_IMAGES, help="Validation images drawn by -i")
+    parser.add_argument('--models', nargs='+', default=EVAL_MODELS, help="tflite models evaluated by -e")
+    parser.add_argument('--threads', type=int, help="Interpreter threads of -e")
+    parser.add_argument('-r', help="Run inference on a folder tree, a file list or an image", action='store_true')
+    parser.add_argument('--batch', type=int, help="Batch size of -e (default 1) and -r (default {})".format(INFER_BATCH))
+    parser.add_argument('--model', help="tflite model of -r, the checkpoint when not given")
+    parser.add_argument('--output', default=INFER_OUTPUT, help="Predictions of -r, .csv or .jsonl")
+    parser.add_argument('--workers', type=int,
+                        help="Processes of -e (default 1), -c (default one per variant) and -i (default 1), interpreters of -r")
+    parser.add_argument('--variants', nargs='+', default=list(CONVERT_VARIANTS), choices=list(CONVERT_VARIANTS),
+                        help="tflite variants made by -c")
+    parser.add_argument('--xla', action='store_true', help="Compile the train step with XLA")
+    parser.add_argument('--precision', default="float32", choices=["float32", "bfloat16"],
+                        help="bfloat16 trains with the mixed_bfloat16 policy")
+    parser.add_argument('--width', type=float, default=1.0, help="Width multiplier of the filters")
+    parser.add_argument('--depthwise', action='store_true', help="Depthwise separable Conv2 and Conv3")
+    parser.add_argument('--global-pool', action='store_true', help="Global average pooling instead of Flatten")
+    parser.add_argument('--resolution', type=int, default=HEIGHT, help="Side of the input images")
+    parser.add_argument('--profile', action='store_true',
+                        help="Record step time, images/sec and input wait of -t, without histograms")
+    parser.add_argument('--profile-steps', help="START,STOP steps traced with the TF profiler by --profile")
+    parser.add_argument('--record-dtype', default="float32", choices=["float32", "uint8"],
+                        help="float32 stores the normalized images, uint8 the pixels")
+    parser.add_argument('--cache', help="Cache decoded images, 'memory' or a file prefix")
+    parser.add_argument('--parallel', type=int, help="Parallel decode calls (default autotune)")
+    parser.add_argument('--prefetch', type=int, help="Batches prefetched (default autotune)")
     return parser.parse_args()
 
-def _get_img(filename, label):
-    img = tf.io.read_file(filename)
-    img = tf.image.decode_jpeg(img)
+def _decode_img(data):
+    img = tf.image.decode_jpeg(data, channels=CHANNELS)
     img = (tf.cast(img, tf.float32)/127.5) - 1
     img = tf.image.resize(img, (HEIGHT, WIDTH))
-    return img, label
+    return img
 
-def get_data(folder):
+def _get_img(filename, label):
+    img = tf.io.read_file(filename)
+    return _decode_img(img), label
+
+# Disk cache of a dataset, named after a hash of where the images come from
+# and of the images themselves. The split changes on every run, so a cache
+# left by another run holds a different split and must not be reused.
+def cache_file(name, source):
+    key = json.dumps([source, HEIGHT, WIDTH, CHANNELS], sort_keys=True)
+    return CACHE + "_" + name + "_" + hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+# Filenames are shuffled before decoding, so the decode of every epoch runs
+# in parallel on a new order. With a cache the images are decoded only once
+# and the shuffle moves to the decoded images.
+def make_dataset(filenames, labels, training, cache_name):
+    data = tf.data.Dataset.from_tensor_slices(
+        (tf.constant(filenames), tf.constant(labels)))
+    if training and CACHE is None:
+        data = data.shuffle(len(filenames), reshuffle_each_iteration=True)
+    options = tf.data.Options()
+    options.experimental_deterministic = not training
+    data = data.with_options(options)
+    data = data.map(_get_img, num_parallel_calls=PARALLEL_CALLS)
+    if CACHE is not None:
+        if CACHE == "":
+            data = data.cache()
+        else:
+            data = data.cache(cache_file(cache_name, ["images", filenames, labels]))
+        if training:
+            data = data.shuffle(min(SHUFFLE_BUFFER, len(filenames)),
+                                reshuffle_each_iteration=True)
+    return data.batch(BATCH_SIZE).prefetch(PREFETCH)
+
+def split_files(folder):
     hot_files = [os.path.join(folder,CLASS_0,f) for f in os.listdir(os.path.join(folder,CLASS_0))]
     random.shuffle(hot_files)
     hot_labels = [0 for x in range(len(hot_files))]
@@ -72,20 +205,269 @@ def get_data(folder):
     filenames = hot_files+not_files
     labels = hot_labels+not_labels
 
-    train_filenames, val_filenames, train_labels, val_labels = ms.train_test_split(
-                            filenames, labels, train_size=0.8)
-    train_data = tf.data.Dataset.from_tensor_slices(
-        (tf.constant(train_filenames), tf.constant(train_labels)))
-    val_data = tf.data.Dataset.from_tensor_slices(
-        (tf.constant(val_filenames), tf.constant(val_labels)))
-    train_data = (train_data.map(_get_img).shuffle(buffer_size=1000).batch(BATCH_SIZE))
-    val_data = (val_data.map(_get_img).shuffle(buffer_size=1000).batch(BATCH_SIZE))
+    return ms.train_test_split(filenames, labels, train_size=0.8)
+
+# A folder with a manifest is a preprocessed dataset
+def is_records(folder):
+    return os.path.isfile(os.path.join(folder, RECORDS_MANIFEST))
+
+def get_data(folder):
+    if is_records(folder):
+        return get_records(folder)
+    train_filenames, val_filenames, train_labels, val_labels = split_files(folder)
+    train_data = make_dataset(train_filenames, train_labels, True, "train")
+    val_data = make_dataset(val_filenames, val_labels, False, "val")
+    return train_data, val_data
+
+def _serialize(img, label):
+    feature = {
+        "image": tf.train.Feature(bytes_list=tf.train.BytesList(
+            value=[tf.io.serialize_tensor(img).numpy()])),
+        "label": tf.train.Feature(int64_list=tf.train.Int64List(
+            value=[int(label)]))}
+    return tf.train.Example(
+        features=tf.train.Features(feature=feature)).SerializeToString()
+
+# Decodes the images in parallel and writes them in shards, returns the
+# names of the shards
+def write_shards(out, split, filenames, labels, dtype):
+    data = tf.data.Dataset.from_tensor_slices(
+        (tf.constant(filenames), tf.constant(labels)))
+    data = data.map(_get_img, num_parallel_calls=PARALLEL_CALLS)
+    if dtype == "uint8":
+        data = data.map(lambda img, label: (tf.cast(tf.round(
+            tf.clip_by_value((img + 1) * 127.5, 0, 255)), tf.uint8), label),
+                        num_parallel_calls=PARALLEL_CALLS)
+    n = (len(filenames) + SHARD_SIZE - 1) // SHARD_SIZE
+    shards = ["{}-{:05d}-of-{:05d}.tfrecord".format(split, i, n)
+              for i in range(n)]
+    writer = None
+    for i, (img, label) in enumerate(data.prefetch(PREFETCH)):
+        if i % SHARD_SIZE == 0:
+            if writer is not None:
+                writer.close()
+            writer = tf.io.TFRecordWriter(
+                os.path.join(out, shards[i // SHARD_SIZE]))
+        writer.write(_serialize(img, label))
+    if writer is not None:
+        writer.close()
+    return shards
+
+# Splits the dataset once and writes both splits as shards of decoded and
+# resized images. The manifest has the counts, the shards and the images of
+# every split.
+def preprocess(folder, out, dtype):
+    print("Preprocessing dataset")
+    os.makedirs(out, exist_ok=True)
+    train_filenames, val_filenames, train_labels, val_labels = split_files(folder)
+    manifest = {"height": HEIGHT, "width": WIDTH, "channels": CHANNELS,
+                "dtype": dtype, "classes": [CLASS_0, CLASS_1],
+                "shard_size": SHARD_SIZE, "splits": {}}
+    for split, filenames, labels in [("train", train_filenames, train_labels),
+                                     ("val", val_filenames, val_labels)]:
+        start = time.perf_counter()
+        shards = write_shards(out, split, filenames, labels, dtype)
+        t = time.perf_counter() - start
+        print("{}: {} images in {} shards, {:.1f} images/sec".format(
+            split, len(filenames), len(shards), len(filenames) / t))
+        manifest["splits"][split] = {
+            "count": len(filenames),
+            "labels": {str(c): labels.count(c) for c in [0, 1]},
+            "shards": shards,
+            "files": filenames}
+    with open(os.path.join(out, RECORDS_MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=1)
+
+def make_parser(dtype):
+    def _parse_record(record):
+        ex = tf.io.parse_single_example(record, RECORD_FEATURES)
+        img = tf.io.parse_tensor(ex["image"], dtype)
+        img = tf.ensure_shape(img, (HEIGHT, WIDTH, CHANNELS))
+        if dtype == tf.uint8:
+            img = (tf.cast(img, tf.float32)/127.5) - 1
+        return img, tf.cast(ex["label"], tf.int32)
+    return _parse_record
+
+# Reads the shards of a split with a parallel interleave, the shard order is
+# shuffled every epoch for training
+def make_record_dataset(folder, manifest, split, training):
+    if (manifest["height"], manifest["width"], manifest["channels"]) != (HEIGHT, WIDTH, CHANNELS):
+        print("Error: The records are not {}x{}x{}".format(HEIGHT, WIDTH, CHANNELS))
+        return None
+    info = manifest["splits"][split]
+    shards = [os.path.join(folder, s) for s in info["shards"]]
+    data = tf.data.Dataset.from_tensor_slices(tf.constant(shards))
+    if training:
+        data = data.shuffle(len(shards), reshuffle_each_iteration=True)
+    options = tf.data.Options()
+    options.experimental_deterministic = not training
+    data = data.with_options(options)
+    data = data.interleave(tf.data.TFRecordDataset,
+                           cycle_length=min(len(shards), 8),
+                           num_parallel_calls=PARALLEL_CALLS)
+    dtype = tf.uint8 if manifest["dtype"] == "uint8" else tf.float32
+    data = data.map(make_parser(dtype), num_parallel_calls=PARALLEL_CALLS)
+    if CACHE is not None:
+        if CACHE == "":
+            data = data.cache()
+        else:
+            data = data.cache(cache_file(split, ["records", os.path.abspath(folder),
+                                                 manifest["dtype"], info]))
+    if training:
+        data = data.shuffle(min(SHUFFLE_BUFFER, info["count"]),
+                            reshuffle_each_iteration=True)
+    return data.batch(BATCH_SIZE).prefetch(PREFETCH)
+
+def get_records(folder):
+    with open(os.path.join(folder, RECORDS_MANIFEST), "r") as f:
+        manifest = json.load(f)
+    train_data = make_record_dataset(folder, manifest, "train", True)
+    val_data = make_record_dataset(folder, manifest, "val", False)
     return train_data, val_data
 
-def train_model(model, folder):
+# Images per second the pipeline delivers over two whole epochs, the first
+# one fills the cache
+def benchmark_input(folder):
+    train_data, val_data = get_data(folder)
+    for epoch in range(2):
+        images = 0
+        start = time.perf_counter()
+        for img, label in train_data:
+            images += int(img.shape[0])
+        t = time.perf_counter() - start
+        print("Epoch {}: {} images in {:.3f}s, {:.1f} images/sec".format(
+            epoch, images, t, images / t))
+
+# Step time, images/sec and time waiting for the input of every training
+# step. Keras takes the batch inside its train function, so the dataset is
+# wrapped to record when each batch leaves the pipeline. The time from the
+# start of the step to that moment is the input wait. A summary of every
+# epoch is printed and appended to profile.jsonl in the log folder.
+class TrainingProfiler(tf.keras.callbacks.Callback):
+    def __init__(self, log_path):
+        super(TrainingProfiler, self).__init__()
+        self.log_path = log_path
+        self.ready = []
+        self.steps = []
+        self.begin = 0.0
+        self.first = True
+
+    def _stamp(self, size):
+        self.ready.append((time.perf_counter(), int(size)))
+        return 0
+
+    def _wrap(self, img, label):
+        t = tf.py_function(self._stamp, [tf.shape(img)[0]], tf.int32)
+        with tf.control_dependencies([t]):
+            img = tf.identity(img)
+        return img, label
+
+    def wrap(self, dataset):
+        return dataset.map(self._wrap)
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.steps = []
+        self.ready = []
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.begin = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        end = time.perf_counter()
+        ready = [r for r in self.ready if r[0] >= self.begin]
+        self.ready = []
+        wait = 0.0
+        images = BATCH_SIZE
+        if len(ready) > 0:
+            wait = min(ready[-1][0], end) - self.begin
+            images = ready[-1][1]
+        # The first step also builds the train function
+        if self.first:
+            self.first = False
+            return
+        self.steps.append((end - self.begin, wait, images))
+
+    def on_epoch_end(self, epoch, logs=None):
+        if len(self.steps) == 0:
+            return
+        step = np.array([s[0] for s in self.steps]) * 1000.0
+        wait = sum(s[1] for s in self.steps)
+        images = sum(s[2] for s in self.steps)
+        summary = {"epoch": epoch, "steps": len(self.steps),
+                   "step_p50_ms": float(np.percentile(step, 50)),
+                   "step_p90_ms": float(np.percentile(step, 90)),
+                   "step_mean_ms": float(np.mean(step)),
+                   "images_per_sec": images / (np.sum(step) / 1000.0),
+                   "input_wait": wait / (np.sum(step) / 1000.0)}
+        print("\nEpoch {}: step p50 {:.1f}ms p90 {:.1f}ms, {:.1f} images/sec, {:.1f}% waiting for input".format(
+            epoch, summary["step_p50_ms"], summary["step_p90_ms"],
+            summary["images_per_sec"], summary["input_wait"] * 100))
+        os.makedirs(self.log_path, exist_ok=True)
+        with open(os.path.join(self.log_path, "profile.jsonl"), "a") as f:
+            f.write(json.dumps(summary) + "\n")
+
+# Compiled DeepHotDog, arch are the arguments of the architecture. The
+# precision policy is global, so it is set before the layers are created.
+def make_model(precision="float32", xla=False, arch={}):
+    if precision == "bfloat16":
+        tf.keras.mixed_precision.set_global_policy("mixed_bfloat16")
+    else:
+        tf.keras.mixed_precision.set_global_policy("float32")
+    model = deepHotDog.DeepHotDog(**arch)
+    model.compile(optimizer=tf.keras.optimizers.RMSprop(),
+                loss=tf.keras.losses.BinaryCrossentropy(),
+                metrics=['accuracy'],
+                jit_compile=xla)
+    model.build(input_shape=(None, model.resolution, model.resolution, CHANNELS))
+    return model
+
+# Seeded images where the label is which of the red or blue channel is
+# brighter, so every mode trains on the same data and can learn it
+def synthetic_data(n, seed):
+    rng = np.random.RandomState(seed)
+    labels = rng.randint(0, 2, n).astype(np.float32)
+    images = rng.uniform(0.0, 1.0, (n, HEIGHT, WIDTH, CHANNELS)).astype(np.float32)
+    images[:, :, :, 0] *= np.where(labels == 1, 1.0, 0.6)[:, None, None]
+    images[:, :, :, 2] *= np.where(labels == 1, 0.6, 1.0)[:, None, None]
+    data = tf.data.Dataset.from_tensor_slices((images, labels))
+    return data.batch(BATCH_SIZE).prefetch(PREFETCH)
+
+# Step time and final accuracy of every training mode. The first epoch
+# traces and compiles the train function, so it is not timed.
+def benchmark_training():
+    train_data = synthetic_data(BENCH_IMAGES, 0).cache()
+    val_data = synthetic_data(BENCH_IMAGES // 4, 1).cache()
+    steps = int(np.ceil(BENCH_IMAGES / BATCH_SIZE))
+    results = []
+    for precision, xla in TRAIN_MODES:
+        tf.keras.backend.clear_session()
+        tf.random.set_seed(0)
+        model = make_model(precision, xla, {"resolution": HEIGHT})
+        start = time.perf_counter()
+        model.fit(train_data, epochs=1, verbose=0)
+        warmup = time.perf_counter() - start
+        times = []
+        for epoch in range(BENCH_EPOCHS):
+            start = time.perf_counter()
+            model.fit(train_data, epochs=1, verbose=0)
+            times.append((time.perf_counter() - start) / steps * 1000.0)
+        loss, acc = model.evaluate(val_data, verbose=0)
+        results.append((precision, xla, warmup, float(np.median(times)), acc))
+    tf.keras.mixed_precision.set_global_policy("float32")
+    base = results[0][3]
+    for precision, xla, warmup, step, acc in results:
+        print("{:8s} xla={:5s}: first epoch {:.1f}s, step {:.1f}ms ({:.2f}x), {:.4f} accuracy".format(
+            precision, str(xla), warmup, step, base / step, acc))
+
+def train_model(model, folder, profile=False, profile_steps=None):
     print("Getting data")
     train_data, val_data = get_data(folder)
     print(train_data)
+    callbacks = []
+    if profile:
+        profiler = TrainingProfiler(LOG_PATH)
+        train_data = profiler.wrap(train_data)
+        callbacks.append(profiler)
 
     print("Training model")
     #model.load_weights(CHECKPOINT_PATH)
@@ -95,183 +477,591 @@ def train_model(model, folder):
                                                 save_best_only=False,
                                                 save_weights_only=False,
                                                 mode='auto', save_freq=500)
-    tensorboard_callback = tf.keras.callbacks.TensorBoard(log_dir=LOG_PATH, histogram_freq=1, write_graph=True, write_images=True)
+    if profile:
+        # Histograms and images cost more than what is being measured
+        tensorboard_callback = tf.keras.callbacks.TensorBoard(log_dir=LOG_PATH, histogram_freq=0, write_graph=False,
+                                                              profile_batch=profile_steps or 0)
+    else:
+        tensorboard_callback = tf.keras.callbacks.TensorBoard(log_dir=LOG_PATH, histogram_freq=1, write_graph=True, write_images=True)
     model.fit(x=train_data,
             epochs=EPOCHS,
             verbose=1,
             validation_data=val_data,
-            callbacks=[checkpoint, tensorboard_callback])
+            callbacks=[checkpoint, tensorboard_callback] + callbacks)
     tensorboard_callback.set_model(model)
-    model.save(os.path.join("model", "1"))
-
-def show_filter(filters, r, c):
-    f_min, f_max = filters.min(), filters.max()
-    filters = (filters - f_min) / (f_max - f_min)
-    fig = pyplot.figure(figsize=(32,64))
-    n_filters, ix = r, 1
-    for i in range(n_filters):
-        f = filters[:, :, :, i]
-        for j in range(c):
-            ax = pyplot.subplot(n_filters, c, ix)
-            ax.set_xticks([])
-            ax.set_yticks([])
-            pyplot.imshow(f[:,:, j], cmap='gray')
-            ix += 1
-    return fig
-
-def show_filters(model):
+    model.save(SAVED_MODEL_PATH)
+
+# One model with the output of every conv and pooling layer, so a single
+# forward pass gives all the activations of a batch
+def activation_model(model):
+    inp = tf.keras.Input(shape=(HEIGHT, WIDTH, CHANNELS))
+    x = inp
+    outputs = []
+    names = []
     for layer in model.layers:
-        if 'Conv' not in layer.name:
-            continue
-        filters, biases = layer.get_weights()
-        print(layer.name, filters.shape)
-        fig = show_filter(filters, filters.shape[3], filters.shape[2])
-        fig.tight_layout()
-        fig.savefig("filter_"+layer.name)
-
-def show_layers(out, r, c):
-    ix = 1
-    for _ in range(r):
-        for _ in range(c):
-            ax = pyplot.subplot(r, c, ix)
-            ax.set_xticks([])
-            ax.set_yticks([])
-            pyplot.imshow(out[0, :, :, ix-1], cmap='gray')
-            ix+=1
-
-def show_intermedium(model, img):
-    l = model.layers[0](np.array([img,]))
-    print([x.name for x in model.layers])
-    fig = pyplot.figure(figsize=(16,8))
-    show_layers(l,2,4)
-    fig.tight_layout()
-    fig.savefig("Conv1")
-
-    l = model.layers[1](l)
-    l = model.layers[2](l)
-    fig = pyplot.figure(figsize=(16,16))
-    show_layers(l,4,6)
-    fig.tight_layout()
-    fig.savefig("Conv2")
-    
-    l = model.layers[3](l)
-    l = model.layers[4](l)
-    fig = pyplot.figure(figsize=(16,16))
-    show_layers(l,8,8)
-    fig.canvas.draw()
-    fig.tight_layout()
-    pyplot.tight_layout()
-    fig.savefig("Conv3")
-
-def info_model(model, folder):
+        x = layer(x)
+        if 'Conv' in layer.name or 'Pooling' in layer.name:
+            outputs.append(x)
+            names.append(layer.name)
+    return tf.keras.Model(inputs=inp, outputs=outputs), names
+
+# Filter mosaic of every conv layer in out/filters
+def show_filters(model, out, workers=1):
+    os.makedirs(os.path.join(out, "filters"), exist_ok=True)
+    jobs = [(os.path.join(out, "filters", layer.name + ".png"), "filter", layer.get_weights()[0])
+            for layer in model.layers if 'Conv' in layer.name]
+    return mosaic.render_all(jobs, workers)
+
+# Activation grids of every conv and pooling layer for every image, in
+# out/image_N
+def show_intermedium(model, images, out, workers=1):
+    act_model, names = activation_model(model)
+    acts = act_model.predict(images, batch_size=max(BATCH_SIZE, 32), verbose=0)
+    if len(names) == 1:
+        acts = [acts]
+    jobs = []
+    for i in range(len(images)):
+        folder = os.path.join(out, "image_{:03d}".format(i))
+        os.makedirs(folder, exist_ok=True)
+        jobs.append((os.path.join(folder, "input.png"), "image", images[i]))
+        for name, act in zip(names, acts):
+            jobs.append((os.path.join(folder, name + ".png"), "activation", act[i]))
+    return mosaic.render_all(jobs, workers)
+
+# Up to n images of the validation set, or the image when folder is a file
+def inspect_images(folder, n):
+    if os.path.isfile(folder):
+        img, label = _get_img(folder, 0)
+        return np.array([img.numpy()])
+    train_data, val_data = get_data(folder)
+    images = []
+    for img, label in val_data:
+        images.append(img.numpy())
+        if sum(len(x) for x in images) >= n:
+            break
+    return np.concatenate(images)[:n]
+
+def info_model(model, folder, n=INSPECT_IMAGES, workers=1):
     print("Info about your model:")
     model.load_weights(CHECKPOINT_PATH)
-    #model.summary()
-    img, label = _get_img(folder, 0)
-    pred = model.predict(np.array([img,]))
-    print(pred)
-    #show_intermedium(model, img)
-    #show_filters(model)
-    #pyplot.show()
-
-def convert_tflite(model, folder):
-    global BATCH_SIZE
-    print("Converting model")
-    BATCH_SIZE = 1
-    model.load_weights(CHECKPOINT_PATH)
-    train_data, val_data = get_data(folder)
-    def representative_dataset():
-        for x,val in train_data:
-            yield [x]
-    converter = tf.lite.TFLiteConverter.from_saved_model("model/1/")
+    images = inspect_images(folder, n)
+    pred = model.predict(images, verbose=0)
+    print(pred[:, 0])
+    start = time.perf_counter()
+    paths = show_intermedium(model, images, INSPECT_PATH, workers)
+    paths += show_filters(model, INSPECT_PATH, workers)
+    print("{} images of {} inputs in {} in {:.1f}s".format(
+        len(paths), len(images), INSPECT_PATH, time.perf_counter() - start))
+
+# Up to REPRESENTATIVE_SIZE training images, half of each class
+def sample_representative(folder):
+    per_class = REPRESENTATIVE_SIZE // 2
+    if is_records(folder):
+        with open(os.path.join(folder, RECORDS_MANIFEST), "r") as f:
+            manifest = json.load(f)
+        shards = [os.path.join(folder, sh) for sh in manifest["splits"]["train"]["shards"]]
+        dtype = tf.uint8 if manifest["dtype"] == "uint8" else tf.float32
+        data = tf.data.TFRecordDataset(shards).map(make_parser(dtype),
+                                                   num_parallel_calls=PARALLEL_CALLS)
+        # Reservoir sampling of every class, the shards are read once
+        samples = {0: [], 1: []}
+        seen = {0: 0, 1: 0}
+        for img, label in data.prefetch(PREFETCH):
+            c = int(label)
+            seen[c] += 1
+            if len(samples[c]) < per_class:
+                samples[c].append(img.numpy())
+            else:
+                r = random.randrange(seen[c])
+                if r < per_class:
+                    samples[c][r] = img.numpy()
+        images = samples[0] + samples[1]
+        labels = [0] * len(samples[0]) + [1] * len(samples[1])
+    else:
+        train_filenames, val_filenames, train_labels, val_labels = split_files(folder)
+        files = []
+        labels = []
+        for c in [0, 1]:
+            of_class = [f for f, l in zip(train_filenames, train_labels) if l == c]
+            chosen = random.sample(of_class, min(per_class, len(of_class)))
+            files += chosen
+            labels += [c] * len(chosen)
+        images = [_get_img(f, 0)[0].numpy() for f in files]
+    return (np.array(images, dtype=np.float32).reshape(-1, HEIGHT, WIDTH, CHANNELS),
+            np.array(labels))
+
+# Hash of what the representative set is sampled from: the name, size and
+# mtime of every image (or record file) of the folder and the input shape
+def representative_key(folder):
+    if is_records(folder):
+        files = [os.path.join(root, f) for root, dirs, fs in os.walk(folder) for f in fs]
+    else:
+        files = [os.path.join(folder, c, f) for c in [CLASS_0, CLASS_1]
+                 for f in os.listdir(os.path.join(folder, c))]
+    stats = [[os.path.relpath(f, folder), os.path.getsize(f), os.path.getmtime(f)]
+             for f in sorted(files)]
+    key = [os.path.abspath(folder), stats, HEIGHT, WIDTH, CHANNELS, REPRESENTATIVE_SIZE]
+    return hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+
+# The representative set of the folder, sampled again when its key changed
+def representative_set(folder):
+    key = representative_key(folder)
+    if os.path.isfile(REPRESENTATIVE_FILE):
+        rep = np.load(REPRESENTATIVE_FILE)
+        if "key" in rep.files and str(rep["key"]) == key:
+            return REPRESENTATIVE_FILE
+    images, labels = sample_representative(folder)
+    np.savez(REPRESENTATIVE_FILE, images=images, labels=labels,
+             folder=os.path.abspath(folder), key=key)
+    print("Representative set: {} images, {} of {}".format(
+        len(labels), int(np.sum(labels == 0)), CLASS_0))
+    return REPRESENTATIVE_FILE
+
+def hash_files(paths):
+    h = hashlib.sha256()
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, f) for root, dirs, fs in os.walk(path) for f in fs)
+        else:
+            files = [path]
+        for fil in files:
+            h.update(os.path.relpath(fil, path).encode('utf-8'))
+            with open(fil, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+    return h.hexdigest()
+
+# Everything that can change the variant: the model, the representative set
+# for int8 and the converter
+def variant_key(variant, model_hash, rep_hash):
+    key = [variant, model_hash, tf.__version__]
+    if variant == "int8":
+        key.append(rep_hash)
+    return hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+
+def make_converter(variant, rep_file, saved_model=SAVED_MODEL_PATH):
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model)
+    if variant == "float32":
+        return converter
     converter.optimizations = [tf.lite.Optimize.DEFAULT]
-    converter.representative_dataset = representative_dataset
-    tflite_model = converter.convert()
-    open("converted_model_quantized.tflite", "wb").write(tflite_model)
-    del converter
+    if variant == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        images = np.load(rep_file)["images"]
+        def representative_dataset():
+            for img in images:
+                yield [img[None]]
+        converter.representative_dataset = representative_dataset
+        # Every op in int8, the input and output stay float for the app
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter
+
+# Worker process of -c, converts a variant
+def convert_worker(job):
+    variant, key, rep_file = job
+    path = CONVERT_VARIANTS[variant]
+    start = time.perf_counter()
+    tflite_model = make_converter(variant, rep_file).convert()
+    convert_time = time.perf_counter() - start
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(tflite_model)
+    os.replace(tmp, path)
+    return {"variant": variant, "file": path, "key": key,
+            "size": os.path.getsize(path), "convert_time": convert_time}
+
+# Quick host latency of a converted variant, run after the conversions so
+# they do not compete for the CPU
+def time_variant(res, rep_file):
+    rep = np.load(rep_file)
+    acc, times = eval_tflite(res["file"], rep["images"][:CONVERT_RUNS], rep["labels"][:CONVERT_RUNS], None, 1)
+    res["latency_p50_ms"] = float(np.percentile(times, 50))
+    res["latency_mean_ms"] = float(np.mean(times))
+    return res
+
+# Converts the variants that changed since the last run, workers at a time
+def convert_tflite(folder, variants=list(CONVERT_VARIANTS), workers=None):
+    print("Converting model")
+    if not os.path.isdir(SAVED_MODEL_PATH):
+        print("Error: {} not found, train the model first".format(SAVED_MODEL_PATH))
+        return
+    rep_file = representative_set(folder)
+    model_hash = hash_files([SAVED_MODEL_PATH])
+    rep_hash = hash_files([rep_file])
+    manifest = {}
+    if os.path.isfile(CONVERT_MANIFEST):
+        with open(CONVERT_MANIFEST, "r") as f:
+            manifest = json.load(f)
+    jobs = []
+    for v in variants:
+        key = variant_key(v, model_hash, rep_hash)
+        old = manifest.get(v)
+        if old is not None and old["key"] == key and os.path.isfile(old["file"]):
+            print("{}: unchanged, {}".format(v, old["file"]))
+            continue
+        jobs.append((v, key, rep_file))
+    if workers is None:
+        workers = len(jobs)
+    if workers > 1 and len(jobs) > 1:
+        # spawn, a forked TensorFlow runtime can hang
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(min(workers, len(jobs))) as pool:
+            results = pool.map(convert_worker, jobs)
+    else:
+        results = [convert_worker(j) for j in jobs]
+    for r in results:
+        manifest[r["variant"]] = time_variant(r, rep_file)
+        print("{}: {} {:.1f} KB in {:.1f}s, host latency p50 {:.3f}ms".format(
+            r["variant"], r["file"], r["size"] / 1024.0, r["convert_time"], r["latency_p50_ms"]))
+    tmp = CONVERT_MANIFEST + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, CONVERT_MANIFEST)
+
+def arch_name(arch):
+    name = "w{}".format(arch.get("width", 1.0))
+    if arch.get("depthwise", False):
+        name += "_dw"
+    if arch.get("global_pool", False):
+        name += "_gap"
+    if "resolution" in arch:
+        name += "_{}".format(arch["resolution"])
+    return name
+
+# Results not beaten by another one in both accuracy and latency
+def pareto_front(results):
+    front = []
+    for r in results:
+        if not any(o["accuracy"] >= r["accuracy"] and o["latency_p50_ms"] <= r["latency_p50_ms"]
+                   and (o["accuracy"] > r["accuracy"] or o["latency_p50_ms"] < r["latency_p50_ms"])
+                   for o in results):
+            front.append(r["name"])
+    return front
 
-    converter = tf.lite.TFLiteConverter.from_saved_model("model/1/")
-    tflite_model = converter.convert()
-    open("converted_model.tflite", "wb").write(tflite_model)
+# Trains every architecture of SWEEP_ARCHS briefly on the same split, then
+# converts it and measures the tflite accuracy, p50 latency and size on the
+# host. The images are decoded at the resolution of every architecture.
+def sweep_architectures(folder):
+    global HEIGHT, WIDTH
+    if is_records(folder):
+        print("Error: The sweep changes the resolution, it needs the images folder")
+        return
+    side = HEIGHT
+    results = []
+    for arch in SWEEP_ARCHS:
+        name = arch_name(arch)
+        print("Training " + name)
+        HEIGHT = WIDTH = arch.get("resolution", side)
+        arch = dict(arch, resolution=HEIGHT)
+        random.seed(0)
+        np.random.seed(0)
+        tf.random.set_seed(0)
+        tf.keras.backend.clear_session()
+        train_data, val_data = get_data(folder)
+        model = make_model("float32", False, arch)
+        start = time.perf_counter()
+        model.fit(train_data, epochs=SWEEP_EPOCHS, verbose=0)
+        train_time = time.perf_counter() - start
+        images = []
+        labels = []
+        for img, label in val_data:
+            images.append(img.numpy())
+            labels.append(label.numpy())
+        images = np.concatenate(images)
+        labels = np.concatenate(labels)
+        with tempfile.TemporaryDirectory() as tmp:
+            saved = os.path.join(tmp, "model")
+            model.save(saved)
+            path = os.path.join(tmp, "model.tflite")
+            with open(path, "wb") as f:
+                f.write(make_converter(SWEEP_VARIANT, None, saved).convert())
+            acc, times = eval_tflite(path, images, labels, None, 1)
+            size = os.path.getsize(path)
+        results.append({"name": name, "arch": arch, "params": int(model.count_params()),
+                        "train_time": train_time, "accuracy": acc, "size": size,
+                        "latency_p50_ms": float(np.percentile(times, 50))})
+    HEIGHT = WIDTH = side
+    front = pareto_front(results)
+    print("{:26s} {:>10s} {:>10s} {:>9s} {:>11s}".format("arch", "params", "size KB", "accuracy", "p50 ms"))
+    for r in sorted(results, key=lambda r: r["latency_p50_ms"]):
+        print("{:26s} {:10d} {:10.1f} {:9.4f} {:11.3f} {}".format(
+            r["name"], r["params"], r["size"] / 1024.0, r["accuracy"], r["latency_p50_ms"],
+            "*" if r["name"] in front else ""))
+    print("* accuracy/latency Pareto front")
+    with open(SWEEP_FILE, "w") as f:
+        json.dump({"results": results, "front": front}, f, indent=1)
 
-def eval_model(folder):
+# Validation set as numpy arrays, so it is decoded once for every model
+def load_validation(folder):
     global BATCH_SIZE
-    print("Evaluating model")
     BATCH_SIZE = 1
     train_data, val_data = get_data(folder)
+    images = []
+    labels = []
+    for img, res in val_data:
+        images.append(img.numpy()[0])
+        labels.append(res.numpy()[0])
+    return np.array(images, dtype=np.float32), np.array(labels)
+
+def quantize(x, detail):
+    scale, zero = detail['quantization']
+    if detail['dtype'] == np.float32 or scale == 0:
+        return x.astype(detail['dtype'])
+    info = np.iinfo(detail['dtype'])
+    return np.clip(np.round(x / scale + zero), info.min, info.max).astype(detail['dtype'])
+
+def dequantize(x, detail):
+    scale, zero = detail['quantization']
+    if detail['dtype'] == np.float32 or scale == 0:
+        return x.astype(np.float32)
+    return (x.astype(np.float32) - zero) * scale
 
-    interpreter = tf.lite.Interpreter(model_path="converted_model.tflite")
+# Runs the model over the images in batches, the last batch is padded so
+# every invoke has the same shape. Returns accuracy and latency of every
+# batch in ms.
+def eval_tflite(path, images, labels, threads, batch):
+    interpreter = tf.lite.Interpreter(model_path=path, num_threads=threads)
+    inp = interpreter.get_input_details()[0]
+    if inp['shape'][0] != batch:
+        interpreter.resize_tensor_input(inp['index'], [batch, HEIGHT, WIDTH, CHANNELS])
     interpreter.allocate_tensors()
-    in_details = interpreter.get_input_details()[0]['index']
-    out_details = interpreter.get_output_details()[0]['index']
+    inp = interpreter.get_input_details()[0]
+    out = interpreter.get_output_details()[0]
+    x = np.zeros((batch, HEIGHT, WIDTH, CHANNELS), dtype=np.float32)
+    x[:min(batch, len(images))] = images[:batch]
+    interpreter.set_tensor(inp['index'], quantize(x, inp))
+    for _ in range(EVAL_WARMUP):
+        interpreter.invoke()
     good = 0
-    bad = 0
-    t = 0.0
-    for img, res in val_data:
-        interpreter.set_tensor(in_details, img)
-        start = time.time()
+    times = []
+    for i in range(0, len(images), batch):
+        n = min(batch, len(images) - i)
+        x[:n] = images[i:i + n]
+        interpreter.set_tensor(inp['index'], quantize(x, inp))
+        start = time.perf_counter_ns()
         interpreter.invoke()
-        end = time.time()
-        output_data = interpreter.get_tensor(out_details)
-        if int(round(res.numpy()[0])) == int(round(output_data[0][0])):
-            good += 1
-        else:
-            bad += 1
-        t += end-start
-    acc = good / (good+bad)
-    t = t / (good+bad)
-    print("TFlite: {} accuracy {}ms mean time".format(acc, t*1000.0))
+        end = time.perf_counter_ns()
+        pred = dequantize(interpreter.get_tensor(out['index']), out)
+        good += int(np.sum(np.round(pred[:n, 0]).astype(int) == labels[i:i + n]))
+        times.append((end - start) / 1e6)
+    return good / len(images), times
+
+def eval_report(path, images, labels, threads, batch):
+    acc, times = eval_tflite(path, images, labels, threads, batch)
+    p50, p90, p99 = np.percentile(times, [50, 90, 99])
+    return {"model": path, "accuracy": acc, "batch": batch,
+            "p50": p50, "p90": p90, "p99": p99,
+            "images_per_sec": len(images) / (sum(times) / 1000.0)}
+
+# Worker process of -e, the validation set comes in a npz file
+def eval_worker(job):
+    path, data, threads, batch = job
+    val = np.load(data)
+    return eval_report(path, val["images"], val["labels"], threads, batch)
+
+def eval_model(folder, models=EVAL_MODELS, threads=None, batch=1, workers=1):
+    print("Evaluating model")
+    images, labels = load_validation(folder)
+    if len(images) == 0:
+        print("Error: Empty validation set")
+        return
+    for m in models:
+        if not os.path.isfile(m):
+            print("Error: {} not found".format(m))
+    models = [m for m in models if os.path.isfile(m)]
+    if workers > 1:
+        # spawn, a forked TensorFlow runtime can hang
+        with tempfile.TemporaryDirectory() as tmp:
+            data = os.path.join(tmp, "val.npz")
+            np.savez(data, images=images, labels=labels)
+            ctx = multiprocessing.get_context("spawn")
+            with ctx.Pool(workers) as pool:
+                reports = pool.map(eval_worker, [(m, data, threads, batch) for m in models])
+    else:
+        reports = [eval_report(m, images, labels, threads, batch) for m in models]
+    for r in reports:
+        print("{}: {:.4f} accuracy, batch {} p50 {:.3f}ms p90 {:.3f}ms p99 {:.3f}ms, {:.1f} images/sec".format(
+            r["model"], r["accuracy"], r["batch"], r["p50"], r["p90"], r["p99"], r["images_per_sec"]))
+
+# Images of a folder tree, of a file with a path per line or a single image
+def list_images(path):
+    if os.path.isdir(path):
+        files = []
+        for root, dirs, fs in os.walk(path):
+            dirs.sort()
+            files += [os.path.join(root, f) for f in sorted(fs)
+                      if f.lower().endswith(INFER_EXTENSIONS)]
+        return files
+    if path.lower().endswith(INFER_EXTENSIONS):
+        return [path]
+    with open(path, "r") as f:
+        return [l.strip() for l in f if l.strip() != ""]
+
+# Decodes the images in parallel, the filename goes along with every image
+# so an image that fails to decode is dropped without shifting the others
+def infer_dataset(files, batch):
+    data = tf.data.Dataset.from_tensor_slices(tf.constant(files))
+    data = data.map(lambda f: _get_img(f, f), num_parallel_calls=PARALLEL_CALLS)
+    data = data.ignore_errors()
+    return data.batch(batch).prefetch(PREFETCH)
 
-    interpreter = tf.lite.Interpreter(model_path="converted_model_quantized.tflite")
+# Interpreter with its input resized to batch and a padded input buffer
+def make_interpreter(path, threads, batch):
+    interpreter = tf.lite.Interpreter(model_path=path, num_threads=threads)
+    inp = interpreter.get_input_details()[0]
+    if inp['shape'][0] != batch:
+        interpreter.resize_tensor_input(inp['index'], [batch, HEIGHT, WIDTH, CHANNELS])
     interpreter.allocate_tensors()
-    in_details = interpreter.get_input_details()[0]['index']
-    out_details = interpreter.get_output_details()[0]['index']
-    
-    good = 0
-    bad = 0
-    t = 0.0
-    for img, res in val_data:
-        interpreter.set_tensor(in_details, img)
-        start = time.time()
-        interpreter.invoke()
-        end = time.time()
-        output_data = interpreter.get_tensor(out_details)
-        if int(round(res.numpy()[0])) == int(round(output_data[0][0])):
-            good += 1
-        else:
-            bad += 1
-        t += end-start
-    acc = good / (good+bad)
-    t = t / (good+bad)
-    print("TFliteQuantized: {} accuracy {}ms mean time".format(acc, t*1000.0))
+    x = np.zeros((batch, HEIGHT, WIDTH, CHANNELS), dtype=np.float32)
+    return interpreter, x
+
+# Scores of the images, at most the batch of the interpreter
+def run_batch(interpreter, x, images):
+    inp = interpreter.get_input_details()[0]
+    out = interpreter.get_output_details()[0]
+    n = len(images)
+    x[:n] = images
+    x[n:] = 0
+    interpreter.set_tensor(inp['index'], quantize(x, inp))
+    interpreter.invoke()
+    return dequantize(interpreter.get_tensor(out['index']), out)[:n, 0]
+
+def invoke_batch(interpreters, images):
+    interpreter, x = interpreters.get()
+    try:
+        return run_batch(interpreter, x, images)
+    finally:
+        interpreters.put((interpreter, x))
+
+class PredictionWriter:
+    def __init__(self, path):
+        self.jsonl = path.endswith(".jsonl")
+        self.f = open(path, "w", newline="")
+        if not self.jsonl:
+            self.csv = csv.writer(self.f)
+            self.csv.writerow(["file", "score", "class"])
+
+    def write(self, files, scores):
+        for fil, score in zip(files, scores):
+            cls = CLASS_1 if score >= 0.5 else CLASS_0
+            if self.jsonl:
+                self.f.write(json.dumps({"file": fil, "score": float(score), "class": cls}) + "\n")
+            else:
+                self.csv.writerow([fil, "{:.6f}".format(score), cls])
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+# Scores every image with the checkpoint or a tflite model and streams the
+# predictions to output in the order of the files. A tflite model runs on a
+# pool of workers interpreters, with at most two batches in flight for each.
+def infer(model, path, tflite, output, batch, threads, workers):
+    files = list_images(path)
+    if len(files) == 0:
+        print("Error: No images in {}".format(path))
+        return
+    if tflite is None:
+        model.load_weights(CHECKPOINT_PATH)
+        pool = None
+    else:
+        if not os.path.isfile(tflite):
+            print("Error: {} not found".format(tflite))
+            return
+        interpreters = queue.Queue()
+        for _ in range(workers):
+            interpreters.put(make_interpreter(tflite, threads, batch))
+        pool = concurrent.futures.ThreadPoolExecutor(workers)
+    print("Scoring {} images".format(len(files)))
+    writer = PredictionWriter(output)
+    pending = collections.deque()
+    done = 0
+    start = time.perf_counter()
+    last = start
+
+    def finish(names, scores):
+        nonlocal done, last
+        writer.write([n.decode('utf-8') for n in names], scores)
+        done += len(names)
+        now = time.perf_counter()
+        if now - last >= INFER_REPORT:
+            last = now
+            print("{}/{} images, {:.1f} images/sec".format(done, len(files), done / (now - start)))
+
+    for images, names in infer_dataset(files, batch):
+        if pool is None:
+            finish(names.numpy(), model.predict_on_batch(images)[:, 0])
+            continue
+        pending.append((names.numpy(), pool.submit(invoke_batch, interpreters, images.numpy())))
+        while len(pending) > 2 * workers or (len(pending) > 0 and pending[0][1].done()):
+            names, future = pending.popleft()
+            finish(names, future.result())
+    while len(pending) > 0:
+        names, future = pending.popleft()
+        finish(names, future.result())
+    if pool is not None:
+        pool.shutdown()
+    writer.close()
+    t = time.perf_counter() - start
+    print("{} images in {:.1f}s, {:.1f} images/sec, {} not decoded, predictions in {}".format(
+        done, t, done / t, len(files) - done, output))
 
 def main():
+    global CACHE, PARALLEL_CALLS, PREFETCH, HEIGHT, WIDTH
     args = parse_arguments()
+    HEIGHT = WIDTH = args.resolution
+    if args.cache is not None:
+        CACHE = "" if args.cache == "memory" else args.cache
+    if args.parallel is not None:
+        PARALLEL_CALLS = args.parallel
+    if args.prefetch is not None:
+        PREFETCH = args.prefetch
+    if args.m:
+        benchmark_training()
     print("Loading Model")
-    model = deepHotDog.DeepHotDog()
-    model.compile(optimizer=tf.keras.optimizers.RMSprop(),
-                loss=tf.keras.losses.BinaryCrossentropy(),
-                metrics=['accuracy'])
-    model.build(input_shape=(None, HEIGHT, WIDTH, CHANNELS))
+    model = make_model(args.precision, args.xla,
+                       {"width": args.width, "depthwise": args.depthwise,
+                        "global_pool": args.global_pool, "resolution": args.resolution})
 
     if args.i:
         if args.f:
-            info_model(model, args.f)
+            info_model(model, args.f, args.inspect, args.workers or 1)
+        else:
+            print("I need pictures!!")
+    if args.p:
+        if args.f:
+            preprocess(args.f, args.records, args.record_dtype)
+        else:
+            print("I need pictures!!")
+    if args.b:
+        if args.f:
+            benchmark_input(args.f)
+        else:
+            print("I need pictures!!")
+    if args.s:
+        if args.f:
+            sweep_architectures(args.f)
         else:
             print("I need pictures!!")
     if args.t:
         if args.f:
-            train_model(model, args.f)
+            train_model(model, args.f, args.profile, args.profile_steps)
         else:
             print("I need pictures!!")
     if args.e:
         if args.f:
-            eval_model(args.f)
+            eval_model(args.f, args.models, args.threads, args.batch or 1, args.workers or 1)
+        else:
+            print("I need pictures!!")
+    if args.r:
+        if args.f:
+            infer(model, args.f, args.model, args.output, args.batch or INFER_BATCH,
+                  args.threads, args.workers or 1)
         else:
             print("I need pictures!!")
     if args.c:
         if args.f:
-            convert_tflite(model, args.f)
+            convert_tflite(args.f, args.variants, args.workers)
         else:
             print("I need pictures!!")
 
@@ -0,0 +1,113 @@
+# Copyright (c) 2019, ARM Limited and Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Activation grids and filter mosaics composed as numpy tiles and saved as
+# images. Only numpy and matplotlib are used, so the rendering can run in
+# worker processes.
+# Usage (worker): python3 mosaic.py < pickled list of render jobs
+
+from matplotlib import pyplot
+import numpy as np
+import os
+import pickle
+import subprocess
+import sys
+
+# Tiles are scaled up to at least this many pixels
+MIN_TILE = 64
+PAD = 1
+
+# Every channel scaled to [0, 1] on its own, a flat channel stays at 0
+def normalize(x):
+    x = x.astype(np.float32)
+    lo = x.min(axis=(0, 1), keepdims=True)
+    hi = x.max(axis=(0, 1), keepdims=True)
+    return (x - lo) / np.where(hi > lo, hi - lo, 1.0)
+
+# tiles is (n, h, w), returns them in a grid of cols columns with a padding
+# of PAD pixels, each tile scaled up by an integer factor
+def grid(tiles, cols):
+    n, h, w = tiles.shape
+    scale = max(1, MIN_TILE // max(h, w))
+    tiles = tiles.repeat(scale, axis=1).repeat(scale, axis=2)
+    h, w = h * scale, w * scale
+    rows = (n + cols - 1) // cols
+    out = np.ones((rows * (h + PAD) + PAD, cols * (w + PAD) + PAD), dtype=np.float32)
+    for i in range(n):
+        r, c = divmod(i, cols)
+        y = PAD + r * (h + PAD)
+        x = PAD + c * (w + PAD)
+        out[y:y + h, x:x + w] = tiles[i]
+    return out
+
+# Activation (h, w, channels) as a square grid of its channels
+def activation_grid(act):
+    act = normalize(act)
+    cols = int(np.ceil(np.sqrt(act.shape[2])))
+    return grid(act.transpose(2, 0, 1), cols)
+
+# Conv kernel (k, k, in, out) with a row per filter and a column per input
+# channel
+def filter_mosaic(kernel):
+    k1, k2, n_in, n_out = kernel.shape
+    kernel = kernel.astype(np.float32)
+    kernel = (kernel - kernel.min()) / max(float(kernel.max() - kernel.min()), 1e-12)
+    tiles = kernel.transpose(3, 2, 0, 1).reshape(n_out * n_in, k1, k2)
+    return grid(tiles, n_in)
+
+# Input image in [-1, 1] as a RGB picture
+def image(img):
+    return np.clip((img + 1.0) / 2.0, 0.0, 1.0)
+
+# A render job is (path, kind, array), kind is "activation", "filter" or
+# "image"
+def render(job):
+    path, kind, x = job
+    if kind == "activation":
+        pyplot.imsave(path, activation_grid(x), cmap='gray', vmin=0.0, vmax=1.0)
+    elif kind == "filter":
+        pyplot.imsave(path, filter_mosaic(x), cmap='gray', vmin=0.0, vmax=1.0)
+    elif x.shape[2] == 1:
+        pyplot.imsave(path, image(x[:, :, 0]), cmap='gray', vmin=0.0, vmax=1.0)
+    else:
+        pyplot.imsave(path, image(x))
+    return path
+
+# Renders the jobs, split across workers processes running this file. They
+# only import numpy and matplotlib, not TensorFlow like main.py would.
+def render_all(jobs, workers=1):
+    workers = min(workers, len(jobs))
+    if workers <= 1:
+        return [render(j) for j in jobs]
+    procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__)], stdin=subprocess.PIPE)
+             for _ in range(workers)]
+    for i, p in enumerate(procs):
+        pickle.dump(jobs[i::workers], p.stdin, protocol=pickle.HIGHEST_PROTOCOL)
+        p.stdin.close()
+    failed = [p for p in procs if p.wait() != 0]
+    if failed:
+        raise RuntimeError("{} of {} mosaic workers failed".format(len(failed), workers))
+    return [j[0] for j in jobs]
+
+if __name__ == "__main__":
+    for job in pickle.load(sys.stdin.buffer):
+        render(job)
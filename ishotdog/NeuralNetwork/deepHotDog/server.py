@@ -0,0 +1,376 @@
+# Copyright (c) 2019, ARM Limited and Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Local inference server of the tflite model. Requests are grouped into
+# micro-batches: a batch is run when it is full or when its first request
+# has waited max-wait ms. Every worker thread of the pool has interpreters
+# preallocated for batches of 1, 2, 4... up to the largest batch, and runs a
+# batch on the smallest one it fits in, so a lone request is not padded to a
+# full batch.
+#
+# POST /predict with a jpeg as body returns the score and the class.
+# GET /metrics returns the counters, the queue depth and the latencies.
+#
+# Usage: python3 server.py --model converted_model_quantized.tflite --port 8000
+#        python3 server.py -b -f [folder of images] --port 8000 --clients 16
+
+import argparse
+import collections
+import http.client
+import http.server
+import json
+import main
+import numpy as np
+import os
+import queue
+import socket
+import socketserver
+import tensorflow as tf
+import threading
+import time
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+INTERPRETERS = 2
+MAX_BATCH = 8
+MAX_WAIT_MS = 5.0
+# Latencies kept for the percentiles of /metrics
+METRICS_WINDOW = 10000
+REQUEST_TIMEOUT = 30.0
+BENCH_CLIENTS = 16
+BENCH_REQUESTS = 1000
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', help="Benchmark a running server", action='store_true')
+    parser.add_argument('-f', help="Folder or file list of the images sent by -b")
+    parser.add_argument('--model', default=main.EVAL_MODELS[-1], help="tflite model served")
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--socket', help="Unix socket instead of host and port")
+    parser.add_argument('--interpreters', type=int, default=INTERPRETERS, help="Interpreters of the pool")
+    parser.add_argument('--threads', type=int, help="Threads of every interpreter")
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH, help="Largest micro-batch")
+    parser.add_argument('--max-wait', type=float, default=MAX_WAIT_MS,
+                        help="ms the first request of a batch waits for others")
+    parser.add_argument('--clients', type=int, default=BENCH_CLIENTS, help="Concurrent clients of -b")
+    parser.add_argument('--requests', type=int, default=BENCH_REQUESTS, help="Requests sent by -b")
+    return parser.parse_args()
+
+def percentiles(values):
+    if len(values) == 0:
+        return {"p50": None, "p90": None, "p99": None}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {"p50": float(p50), "p90": float(p90), "p99": float(p99)}
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched = 0
+        self.sizes = {}
+        self.max_depth = 0
+        self.latency = collections.deque(maxlen=METRICS_WINDOW)
+        self.wait = collections.deque(maxlen=METRICS_WINDOW)
+        self.invoke = collections.deque(maxlen=METRICS_WINDOW)
+
+    def request(self, latency_ms, error=False):
+        with self.lock:
+            self.requests += 1
+            if error:
+                self.errors += 1
+            else:
+                self.latency.append(latency_ms)
+
+    def batch(self, size, waits_ms, invoke_ms):
+        with self.lock:
+            self.batches += 1
+            self.batched += size
+            self.sizes[size] = self.sizes.get(size, 0) + 1
+            self.wait.extend(waits_ms)
+            self.invoke.append(invoke_ms)
+
+    def depth(self, depth):
+        with self.lock:
+            self.max_depth = max(self.max_depth, depth)
+
+    def snapshot(self, depth):
+        with self.lock:
+            return {"uptime": time.time() - self.start,
+                    "requests": self.requests, "errors": self.errors,
+                    "batches": self.batches,
+                    "mean_batch": self.batched / self.batches if self.batches > 0 else 0.0,
+                    "batch_sizes": {str(k): v for k, v in sorted(self.sizes.items())},
+                    "queue_depth": depth, "max_queue_depth": self.max_depth,
+                    "latency_ms": percentiles(list(self.latency)),
+                    "queue_wait_ms": percentiles(list(self.wait)),
+                    "invoke_ms": percentiles(list(self.invoke))}
+
+# Batch sizes with an interpreter: powers of two below max_batch and max_batch
+def buckets(max_batch):
+    sizes = []
+    b = 1
+    while b < max_batch:
+        sizes.append(b)
+        b *= 2
+    return sizes + [max_batch]
+
+class Request:
+    def __init__(self, img):
+        self.img = img
+        self.arrival = time.perf_counter()
+        self.done = threading.Event()
+        self.score = None
+        self.error = None
+        self.batch = 0
+
+class MicroBatcher:
+    def __init__(self, model, interpreters, threads, max_batch, max_wait_ms, metrics):
+        self.queue = queue.Queue()
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.metrics = metrics
+        self.buckets = buckets(max_batch)
+        self.workers = []
+        for _ in range(interpreters):
+            pool = {b: main.make_interpreter(model, threads, b) for b in self.buckets}
+            t = threading.Thread(target=self.loop, args=(pool,), daemon=True)
+            self.workers.append(t)
+
+    def start(self):
+        for t in self.workers:
+            t.start()
+
+    def submit(self, img):
+        req = Request(img)
+        self.queue.put(req)
+        self.metrics.depth(self.queue.qsize())
+        return req
+
+    # The first request and the ones that arrive before its deadline, up to
+    # max_batch. Requests already queued are taken even past the deadline.
+    def collect(self):
+        first = self.queue.get()
+        batch = [first]
+        deadline = first.arrival + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def loop(self, pool):
+        while True:
+            batch = self.collect()
+            size = min(b for b in self.buckets if b >= len(batch))
+            interpreter, x = pool[size]
+            start = time.perf_counter()
+            try:
+                scores = main.run_batch(interpreter, x, np.stack([r.img for r in batch]))
+            except Exception as e:
+                scores = None
+                error = str(e)
+            end = time.perf_counter()
+            for i, r in enumerate(batch):
+                r.batch = len(batch)
+                if scores is None:
+                    r.error = error
+                else:
+                    r.score = float(scores[i])
+                r.done.set()
+            self.metrics.batch(len(batch), [(start - r.arrival) * 1000.0 for r in batch],
+                               (end - start) * 1000.0)
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self.reply(200, self.server.metrics.snapshot(self.server.batcher.queue.qsize()))
+        elif self.path == "/health":
+            self.reply(200, {"status": "ok"})
+        else:
+            self.reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        start = time.perf_counter()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path != "/predict":
+            self.reply(404, {"error": "not found"})
+            return
+        try:
+            img = self.server.decode(tf.constant(body)).numpy()
+        except tf.errors.InvalidArgumentError:
+            self.server.metrics.request(0.0, error=True)
+            self.reply(400, {"error": "not a jpeg image"})
+            return
+        req = self.server.batcher.submit(img)
+        if not req.done.wait(REQUEST_TIMEOUT) or req.error is not None:
+            self.server.metrics.request(0.0, error=True)
+            self.reply(500, {"error": req.error or "timeout"})
+            return
+        latency = (time.perf_counter() - start) * 1000.0
+        self.server.metrics.request(latency)
+        self.reply(200, {"score": req.score,
+                         "class": main.CLASS_1 if req.score >= 0.5 else main.CLASS_0,
+                         "batch": req.batch, "latency_ms": latency})
+
+class TCPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def serve(args):
+    if not os.path.isfile(args.model):
+        print("Error: {} not found".format(args.model))
+        return
+    # The images are resized to the input of the model
+    shape = tf.lite.Interpreter(model_path=args.model).get_input_details()[0]['shape']
+    main.HEIGHT, main.WIDTH = int(shape[1]), int(shape[2])
+    metrics = Metrics()
+    batcher = MicroBatcher(args.model, args.interpreters, args.threads, args.max_batch,
+                           args.max_wait, metrics)
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixServer(args.socket, Handler)
+        where = args.socket
+    else:
+        server = TCPServer((args.host, args.port), Handler)
+        where = "http://{}:{}".format(args.host, args.port)
+    server.metrics = metrics
+    server.batcher = batcher
+    server.decode = tf.function(main._decode_img, input_signature=[tf.TensorSpec([], tf.string)])
+    batcher.start()
+    print("Serving {} on {}, {} interpreters, batches of up to {} within {}ms".format(
+        args.model, where, args.interpreters, args.max_batch, args.max_wait))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+class UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super(UnixConnection, self).__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+def connect(args):
+    if args.socket:
+        return UnixConnection(args.socket)
+    return http.client.HTTPConnection(args.host, args.port)
+
+def request(conn, method, path, body=None):
+    conn.request(method, path, body=body)
+    resp = conn.getresponse()
+    return resp.status, json.loads(resp.read())
+
+# Closed loop load: every client sends its next image as soon as the last one
+# is answered. The first request of every client is not timed.
+def bench(args):
+    files = main.list_images(args.f)
+    if len(files) == 0:
+        print("Error: No images in {}".format(args.f))
+        return
+    images = []
+    for fil in files[:args.requests]:
+        with open(fil, "rb") as f:
+            images.append(f.read())
+    counter = iter(range(args.requests))
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+
+    def client():
+        conn = connect(args)
+        request(conn, "POST", "/predict", images[0])
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            start = time.perf_counter()
+            try:
+                status, data = request(conn, "POST", "/predict", images[i % len(images)])
+            except (OSError, http.client.HTTPException, ValueError):
+                status = None
+                conn.close()
+                conn = connect(args)
+            t = (time.perf_counter() - start) * 1000.0
+            with lock:
+                if status == 200:
+                    latencies.append(t)
+                else:
+                    errors[0] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=client) for _ in range(args.clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    t = time.perf_counter() - start
+    p = percentiles(latencies)
+    print("{} requests from {} clients in {:.1f}s, {:.1f} requests/sec, {} errors".format(
+        len(latencies), args.clients, t, len(latencies) / t, errors[0]))
+    if len(latencies) > 0:
+        print("Latency p50 {:.2f}ms p90 {:.2f}ms p99 {:.2f}ms".format(p["p50"], p["p90"], p["p99"]))
+    status, m = request(connect(args), "GET", "/metrics")
+    print("Server: mean batch {:.2f}, max queue depth {}, queue wait p50 {}ms, invoke p50 {}ms".format(
+        m["mean_batch"], m["max_queue_depth"],
+        "{:.2f}".format(m["queue_wait_ms"]["p50"]) if m["queue_wait_ms"]["p50"] is not None else "-",
+        "{:.2f}".format(m["invoke_ms"]["p50"]) if m["invoke_ms"]["p50"] is not None else "-"))
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    if args.b:
+        if args.f:
+            bench(args)
+        else:
+            print("I need pictures!!")
+    else:
+        serve(args)
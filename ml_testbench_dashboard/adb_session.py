@@ -0,0 +1,184 @@
+# Copyright (c) 2019, ARM Limited and Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Long lived "adb shell" sessions. Every command is written to the stdin of
+# one shell per device and its output is framed with sentinels, so we only
+# pay the adb handshake once instead of once per command.
+
+import atexit
+import os
+import subprocess
+import threading
+import uuid
+
+# Set ADB to another executable (e.g. fake_adb.py) to run without a device
+ADB = os.environ.get("ADB", "adb")
+# Where the shell leaves the stderr of the last command, every session has
+# its own file so sessions on the same device do not clobber each other
+STDERR_FILE = "/data/local/tmp/.testbench_stderr"
+
+class AdbSession:
+    def __init__(self, serial=None):
+        self.serial = serial
+        self.token = ("__TB_" + uuid.uuid4().hex + "__").encode('ascii')
+        self.stderr_file = STDERR_FILE + "_" + self.token.decode('ascii').strip('_')
+        self.process = None
+        self.lock = threading.Lock()
+
+    def adb_command(self, comm):
+        base = [ADB]
+        if self.serial is not None:
+            base = base + ["-s", self.serial]
+        return base + comm
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.adb_command(["shell"]), stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def close(self):
+        if not self.alive():
+            return
+        try:
+            self.process.stdin.write(("rm -f " + self.stderr_file + "\nexit\n").encode('utf-8'))
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+        self.process.stdout.close()
+        self.process = None
+
+    # Wraps the command in a subshell so exports and cds do not leak into
+    # the session, then prints the exit code and the stderr between sentinels.
+    # The stdin of the command is /dev/null, otherwise a command reading it
+    # would eat the commands queued after it in the shell.
+    def frame(self, comm):
+        t = self.token.decode('ascii')
+        return ("( " + " ".join(comm) + " ) </dev/null 2>" + self.stderr_file + "\n"
+                "printf '\\n%s %d\\n' " + t + " $?\n"
+                "cat " + self.stderr_file + " 2>/dev/null\n"
+                "printf '\\n%s\\n' " + t + "\n").encode('utf-8')
+
+    def read_until(self, buf):
+        marker = b"\n" + self.token
+        while True:
+            i = buf.find(marker)
+            if i >= 0:
+                end = buf.find(b"\n", i + len(marker))
+                if end >= 0:
+                    return buf[:i], buf[i + len(marker):end], buf[end + 1:]
+            chunk = self.process.stdout.read(65536)
+            if not chunk:
+                raise EOFError("adb shell closed")
+            buf = buf + chunk
+
+    def read_frame(self, buf):
+        o, code, buf = self.read_until(buf)
+        e, _, buf = self.read_until(buf)
+        return int(code.strip()), o, e, buf
+
+    # Runs several commands with one write, returns a list of (ret, out, err)
+    def run_batch(self, comms):
+        with self.lock:
+            out = []
+            try:
+                if not self.alive():
+                    self.start()
+                self.process.stdin.write(b"".join(self.frame(c) for c in comms))
+                self.process.stdin.flush()
+                buf = b""
+                for _ in comms:
+                    r, o, e, buf = self.read_frame(buf)
+                    out.append((r, o, e))
+            except (OSError, EOFError, ValueError) as err:
+                # The shell died (device unplugged, reboot...), start a new
+                # one on the next call
+                if self.process is not None:
+                    self.process.kill()
+                self.process = None
+                fail = (255, b"", str(err).encode('utf-8'))
+                out = out + [fail] * (len(comms) - len(out))
+            return out
+
+    def run(self, comm):
+        return self.run_batch([comm])[0]
+
+    # Like run, but every line of stdout is given to feed as soon as it
+    # arrives instead of returning the whole output
+    def run_stream(self, comm, feed):
+        with self.lock:
+            try:
+                if not self.alive():
+                    self.start()
+                self.process.stdin.write(self.frame(comm))
+                self.process.stdin.flush()
+                buf = b""
+                code = None
+                while code is None:
+                    chunk = self.process.stdout.read(65536)
+                    if not chunk:
+                        raise EOFError("adb shell closed")
+                    buf = buf + chunk
+                    start = 0
+                    end = buf.find(b"\n")
+                    while end >= 0:
+                        line = buf[start:end]
+                        start = end + 1
+                        if line.startswith(self.token):
+                            code = int(line[len(self.token):].strip())
+                            break
+                        feed(line)
+                        end = buf.find(b"\n", start)
+                    buf = buf[start:]
+                e, _, buf = self.read_until(buf)
+                return code, b"", e
+            except (OSError, EOFError, ValueError) as err:
+                if self.process is not None:
+                    self.process.kill()
+                self.process = None
+                return 255, b"", str(err).encode('utf-8')
+
+SESSIONS = {}
+SESSIONS_LOCK = threading.Lock()
+# Device used by the commands of each thread
+CURRENT = threading.local()
+
+def set_device(serial):
+    CURRENT.serial = serial
+
+def get_session(serial=None):
+    if serial is None:
+        serial = getattr(CURRENT, 'serial', None)
+    with SESSIONS_LOCK:
+        if serial not in SESSIONS:
+            SESSIONS[serial] = AdbSession(serial)
+        return SESSIONS[serial]
+
+@atexit.register
+def close_sessions():
+    with SESSIONS_LOCK:
+        for s in SESSIONS.values():
+            s.close()
+        SESSIONS.clear()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019, ARM Limited and Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Micro benchmark of the output parsers.
+# Usage: ./bench_parsers.py [recorded benchmark_model or ExecuteNetwork outputs]
+# Without files it generates outputs of growing size.
+
+import json
+from parsers import parse_armnn, parse_tflite
+import sys
+import time
+
+SIZES = [100, 1000, 10000, 100000]
+REPEAT = 3
+
+def tflite_output(layers):
+    row = "\t%24s\t%17.3f\t%9.3f\t%9.3f\t%7.3f%%\t%7.3f%%\t%10.3f\t%9d\t[%s]"
+    header = ("\t[node type]\t[start]\t[first]\t[avg ms]\t[%]\t[cdf%]"
+              "\t[mem KB]\t[times called]\t[Name]")
+    lines = ["Initialized session in 25.1ms",
+             "count=1 curr=1000",
+             "count=10 first=950 curr=900 min=880 max=950 avg=905 std=20",
+             "Average inference timings in us: Warmup: 1000, Init: 25100, "
+             "no stats: 900",
+             "============================== Run Order "
+             "==============================",
+             header]
+    for i in range(layers):
+        lines.append(row % ("CONV_2D", i * 0.01, 0.01, 0.01, 0.1, 0.1, 0.0, 1,
+                            "layer_" + str(i)))
+    lines.append("")
+    lines.append(str(layers) + " nodes observed")
+    return [(l + "\n").encode('ascii') for l in lines]
+
+def armnn_output(layers):
+    ex = {"type": "Event",
+          "Wall clock time_#2": {"type": "Measurement", "raw": [1000.0],
+                                 "unit": "us"}}
+    for i in range(layers):
+        ex["Workload_Execute_#" + str(i + 3)] = {
+            "type": "Event",
+            "Wall clock time_#" + str(i + 3): {"type": "Measurement",
+                                               "raw": [10.0], "unit": "us"}}
+    data = {"ArmNN": {"inference_measurements_#1": {"type": "Event",
+                                                    "Execute_#2": ex}}}
+    st = json.dumps(data, indent=4)
+    return [(l + "\n").encode('ascii') for l in st.split("\n")]
+
+def bench(name, parse, lines):
+    size = sum(len(l) for l in lines)
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        parse(lines)
+        t = time.perf_counter() - start
+        if best is None or t < best:
+            best = t
+    print("%-30s %10d lines %8.2f MB %10.2f ms %8.1f MB/s" % (
+        name, len(lines), size / 1e6, best * 1000, size / 1e6 / best))
+
+def main(args):
+    if len(args) > 1:
+        for fil in args[1:]:
+            with open(fil, "rb") as f:
+                lines = f.readlines()
+            if any(l.startswith(b'{') for l in lines):
+                bench(fil, parse_armnn, lines)
+            else:
+                bench(fil, parse_tflite, lines)
+        return
+    for n in SIZES:
+        bench("tflite " + str(n) + " layers", parse_tflite, tflite_output(n))
+    for n in SIZES:
+        bench("armnn " + str(n) + " layers", parse_armnn, armnn_output(n))
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019, ARM Limited and Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Compact results file. The layer names are interned once for the whole file
+# and the per layer times and samples of every configuration are stored as
+# little endian typed arrays after a small JSON summary with the scalars,
+# the top layers and the time per layer type of each configuration. A reader
+# only needs the summary to list and compare the configurations and reads the
+# arrays of one configuration when it is selected.
+#
+# Layout: "TBC1", uint32 length of the summary, summary, padding to 8 bytes,
+# data. Offsets in the summary are relative to the start of the data.
+#
+# Usage: ./compact.py export results.tbc results.json
+#        ./compact.py pack results.json results.tbc
+
+import json
+import numpy as np
+import os
+import struct
+import sys
+
+MAGIC = b"TBC1"
+VERSION = 2
+TOP_LAYERS = 10
+# Fields moved from the summary to the data section. The times are doubles
+# so the export gives back the same numbers as the JSON results, version 1
+# files stored them as floats.
+ARRAYS = {"layer": "<i4", "name": "<i4", "time": "<f8", "samples": "<f8"}
+ARRAYS_V1 = {"layer": "<i4", "name": "<i4", "time": "<f4", "samples": "<f4"}
+EXTRA = ["telemetry", "node_types"]
+
+def is_compact(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+class Strings:
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def get(self, s):
+        if s is None:
+            return -1
+        if s not in self.index:
+            self.index[s] = len(self.strings)
+            self.strings.append(s)
+        return self.index[s]
+
+# Appends the bytes to the data section aligned to 8, returns [offset, size]
+def add_block(blocks, size, raw):
+    pad = (-size) % 8
+    if pad > 0:
+        blocks.append(b"\0" * pad)
+    blocks.append(raw)
+    return [size + pad, len(raw)], size + pad + len(raw)
+
+def pack_entry(entry, strings, blocks, size):
+    res = {k: v for k, v in entry.items()
+           if k not in ["times", "samples"] + EXTRA}
+    times = entry.get("times", [])
+    cols = {"layer": [strings.get(t["layer"]) for t in times],
+            "name": [strings.get(t.get("name")) for t in times],
+            "time": [t["time"] for t in times],
+            "samples": entry.get("samples", [])}
+    detail = {}
+    for k, dtype in ARRAYS.items():
+        raw = np.asarray(cols[k], dtype=dtype).tobytes()
+        detail[k], size = add_block(blocks, size, raw)
+    extra = {k: entry[k] for k in EXTRA if k in entry}
+    if len(extra) > 0:
+        raw = json.dumps(extra).encode('utf-8')
+        detail["extra"], size = add_block(blocks, size, raw)
+    res["detail"] = detail
+    res["layer_count"] = len(times)
+    top = sorted(range(len(times)), key=lambda i: -times[i]["time"])
+    res["top"] = [[cols["layer"][i], cols["name"][i], times[i]["time"]]
+                  for i in top[:TOP_LAYERS]]
+    totals = {}
+    for l, t in zip(cols["layer"], cols["time"]):
+        totals[l] = totals.get(l, 0.0) + t
+    res["type_totals"] = [[l, t] for l, t in totals.items()]
+    return res, size
+
+# Packs the results dict of the testbench, {workload: [config]}
+def pack(data):
+    strings = Strings()
+    blocks = []
+    size = 0
+    workloads = {}
+    for name, entries in data.items():
+        workloads[name] = []
+        for entry in entries:
+            res, size = pack_entry(entry, strings, blocks, size)
+            workloads[name].append(res)
+    summary = {"version": VERSION, "strings": strings.strings,
+               "workloads": workloads}
+    raw = json.dumps(summary).encode('utf-8')
+    head = MAGIC + struct.pack("<I", len(raw)) + raw
+    head += b"\0" * ((-len(head)) % 8)
+    return [head] + blocks
+
+# Written aside and renamed like journal.write_json
+def write(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        for block in pack(data):
+            f.write(block)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+# Summary of the file plus the offset of the data section in "data_offset"
+def read_summary(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return None
+        n = struct.unpack("<I", f.read(4))[0]
+        summary = json.loads(f.read(n).decode('utf-8'))
+    start = len(MAGIC) + 4 + n
+    summary["data_offset"] = start + (-start) % 8
+    return summary
+
+def read_block(f, summary, block):
+    f.seek(summary["data_offset"] + block[0])
+    return f.read(block[1])
+
+# Per layer times, samples and extra fields of one configuration of the
+# summary, in the format of the JSON results
+def read_detail(path, summary, entry):
+    strings = summary["strings"]
+    detail = entry["detail"]
+    cols = {}
+    arrays = ARRAYS if summary.get("version", 1) >= 2 else ARRAYS_V1
+    with open(path, "rb") as f:
+        for k, dtype in arrays.items():
+            raw = read_block(f, summary, detail[k])
+            cols[k] = np.frombuffer(raw, dtype=dtype).tolist()
+        extra = {}
+        if "extra" in detail:
+            extra = json.loads(read_block(f, summary, detail["extra"]))
+    times = []
+    for l, n, t in zip(cols["layer"], cols["name"], cols["time"]):
+        layer = {"layer": strings[l]}
+        if n >= 0:
+            layer["name"] = strings[n]
+        layer["time"] = t
+        times.append(layer)
+    res = {"times": times}
+    if len(cols["samples"]) > 0:
+        res["samples"] = cols["samples"]
+    res.update(extra)
+    return res
+
+# Whole results back in the JSON format
+def read(path):
+    summary = read_summary(path)
+    data = {}
+    for name, entries in summary["workloads"].items():
+        data[name] = []
+        for entry in entries:
+            res = {k: v for k, v in entry.items()
+                   if k not in ["detail", "layer_count", "top", "type_totals"]}
+            res.update(read_detail(path, summary, entry))
+            data[name].append(res)
+    return data
+
+# Results of the testbench in either format
+def load(path):
+    if is_compact(path):
+        return read(path)
+    with open(path, "r") as f:
+        return json.load(f)
+
+def main(args):
+    if len(args) != 4 or args[1] not in ["export", "pack"]:
+        print("Usage: " + args[0] + " export|pack input output")
+        return 1
+    data = load(args[2])
+    if args[1] == "export":
+        with open(args[3], "w") as f:
+            json.dump(data, f)
+    else:
+        write(args[3], data)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
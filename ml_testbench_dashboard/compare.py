@@ -0,0 +1,209 @@
+# Copyright (c) 2019, ARM Limited and Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Compares two result files of the testbench. Configurations are matched by
+# workload, type and device and their layers by type, name and position.
+# A configuration regresses when its latency grows more than the threshold
+# and, when both files have the raw samples, the difference is significant.
+
+import argparse
+import compact
+import json
+import os
+from stats import mann_whitney, percentile
+
+THRESHOLD = 0.05
+ALPHA = 0.05
+TOP_LAYERS = 5
+
+def config_key(name, entry, ignore_device):
+    if ignore_device:
+        return (name, entry['type'])
+    return (name, entry['type'], entry.get('device'))
+
+# Entries by configuration key. Several entries with the same key (the same
+# configuration on several devices with ignore_device) are replaced by the
+# one with the median latency, the keys and counts of those are returned too.
+def configs(data, ignore_device):
+    groups = {}
+    for name, entries in data.items():
+        for entry in entries:
+            groups.setdefault(config_key(name, entry, ignore_device), []).append(entry)
+    res = {}
+    merged = []
+    for k, entries in groups.items():
+        if len(entries) > 1:
+            entries = sorted(entries, key=latency)
+            merged.append([list(k), len(entries)])
+        res[k] = entries[(len(entries) - 1) // 2]
+    return res, merged
+
+# Layer times by (type, name, occurrence), layers without a name (ArmNN) are
+# told apart by the order they run in
+def layers(entry):
+    res = {}
+    seen = {}
+    for t in entry.get('times', []):
+        k = (t['layer'], t.get('name'))
+        n = seen.get(k, 0)
+        seen[k] = n + 1
+        res[k + (n,)] = res.get(k + (n,), 0.0) + t['time']
+    return res
+
+# Median of the samples when there are some, the mean time otherwise
+def latency(entry):
+    if len(entry.get('samples', [])) > 0:
+        return percentile(entry['samples'], 50)
+    return entry['mean_time']
+
+def compare_layers(base, new):
+    b = layers(base)
+    n = layers(new)
+    res = []
+    for k in list(b.keys()) + [k for k in n.keys() if k not in b]:
+        res.append({"layer": k[0], "name": k[1], "index": k[2],
+                    "base": b.get(k), "new": n.get(k),
+                    "delta": n.get(k, 0.0) - b.get(k, 0.0)})
+    res.sort(key=lambda l: -l['delta'])
+    slower = sum(l['delta'] for l in res if l['delta'] > 0)
+    for l in res:
+        l['share'] = l['delta'] / slower if l['delta'] > 0 else 0.0
+    return res
+
+def compare_config(base, new, threshold, alpha):
+    b = latency(base)
+    n = latency(new)
+    res = {"base": b, "new": n, "delta": n - b,
+           "relative": (n - b) / b if b > 0 else 0.0,
+           "base_mean": base['mean_time'], "new_mean": new['mean_time'],
+           "p_value": None}
+    if len(base.get('samples', [])) > 0 and len(new.get('samples', [])) > 0:
+        res['p_value'] = mann_whitney(base['samples'], new['samples'])
+    significant = res['p_value'] is None or res['p_value'] < alpha
+    res['regression'] = res['relative'] > threshold and significant
+    res['improvement'] = res['relative'] < -threshold and significant
+    for k in ["peak_rss_kb"]:
+        if k in base.get('memory', {}) and k in new.get('memory', {}):
+            res[k] = [base['memory'][k], new['memory'][k]]
+    res['layers'] = compare_layers(base, new)
+    return res
+
+def compare(base, new, threshold=THRESHOLD, alpha=ALPHA,
+            ignore_device=False):
+    b, b_merged = configs(base, ignore_device)
+    n, n_merged = configs(new, ignore_device)
+    report = {"configs": [], "missing": [], "added": [],
+              "merged": {"base": b_merged, "new": n_merged}}
+    for k in b.keys():
+        if k not in n:
+            report['missing'].append(list(k))
+            continue
+        res = compare_config(b[k], n[k], threshold, alpha)
+        res['config'] = list(k)
+        report['configs'].append(res)
+    report['added'] = [list(k) for k in n.keys() if k not in b]
+    report['regressions'] = sum(1 for c in report['configs']
+                                if c['regression'])
+    return report
+
+def config_text(k):
+    return " ".join(str(v) for v in k if v is not None)
+
+def print_report(report, top):
+    for which in ["base", "new"]:
+        for k, count in report['merged'][which]:
+            print("Warning: " + str(count) + " results of " + config_text(k)
+                  + " in the " + which + " file, using the one with the "
+                  "median latency")
+    for c in report['configs']:
+        mark = ""
+        if c['regression']:
+            mark = " REGRESSION"
+        elif c['improvement']:
+            mark = " improvement"
+        p = ""
+        if c['p_value'] is not None:
+            p = " p=%.4f" % c['p_value']
+        mem = ""
+        if 'peak_rss_kb' in c:
+            mem = " peak RSS %.1fMB -> %.1fMB" % (c['peak_rss_kb'][0] / 1024.0,
+                                                c['peak_rss_kb'][1] / 1024.0)
+        print("%s: %.3fms -> %.3fms (%+.3fms, %+.1f%%)%s%s%s" % (
+            config_text(c['config']), c['base'], c['new'], c['delta'],
+            c['relative'] * 100, p, mem, mark))
+        if not c['regression']:
+            continue
+        for l in c['layers'][:top]:
+            if l['delta'] <= 0:
+                break
+            name = l['layer']
+            if l['name'] is not None:
+                name = name + " " + l['name']
+            print("\t%s #%d: %+.3fms (%.0f%% of the slowdown)" % (
+                name, l['index'], l['delta'], l['share'] * 100))
+    for k in report['missing']:
+        print("Error: " + config_text(k) + " is not in the new results")
+    for k in report['added']:
+        print("New configuration " + config_text(k))
+    if len(report['configs']) == 0 and len(report['added']) > 0:
+        print("No configuration matched, use --ignore-device if the results "
+              "come from other devices")
+    print(str(report['regressions']) + " regressions in "
+          + str(len(report['configs'])) + " configurations, "
+          + str(len(report['missing'])) + " missing")
+
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(
+        prog="testbench.py compare",
+        description="Compares two result files of the testbench")
+    parser.add_argument('base', help="results to compare against")
+    parser.add_argument('new', help="new results")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help="Relative slowdown that is a regression")
+    parser.add_argument('--alpha', type=float, default=ALPHA,
+                        help="Significance level of the test on the samples")
+    parser.add_argument('--top', type=int, default=TOP_LAYERS,
+                        help="Layers listed for every regression")
+    parser.add_argument('--ignore-device', action='store_true',
+                        help="Match configurations run on different devices")
+    parser.add_argument('--output', help="json file for the full report")
+    return parser.parse_args(args)
+
+# Returns 1 when a configuration regressed and 2 when a configuration of
+# the base is missing from the new results
+def main(args):
+    args = parse_arguments(args)
+    for fil in [args.base, args.new]:
+        if not os.path.isfile(fil):
+            print("Error: File not found " + fil)
+            return 128
+    report = compare(compact.load(args.base), compact.load(args.new),
+                     args.threshold, args.alpha, args.ignore_device)
+    print_report(report, args.top)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f)
+    if report['regressions'] > 0:
+        return 1
+    if len(report['missing']) > 0:
+        return 2
+    return 0
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019, ARM Limited and Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Static cost of every operator of a .tflite model: multiply-accumulates,
+# bytes of parameters and bytes of activations read and written. Joined with
+# the per layer times of a result file it gives the GMAC/s and GB/s each
+# operator achieves, and with the peaks of the device how far it is from the
+# roofline.
+# Usage: ./cost_model.py model.tflite [results.json|results.tbc]
+#            [--workload name] [--peak-gmacs X --peak-gbs Y] [--output file]
+
+import argparse
+import compact
+import json
+import os
+import struct
+import sys
+
+# BuiltinOperator of schema.fbs
+BUILTIN_OPS = [
+    "ADD", "AVERAGE_POOL_2D", "CONCATENATION", "CONV_2D", "DEPTHWISE_CONV_2D",
+    "DEPTH_TO_SPACE", "DEQUANTIZE", "EMBEDDING_LOOKUP", "FLOOR",
+    "FULLY_CONNECTED", "HASHTABLE_LOOKUP", "L2_NORMALIZATION", "L2_POOL_2D",
+    "LOCAL_RESPONSE_NORMALIZATION", "LOGISTIC", "LSH_PROJECTION", "LSTM",
+    "MAX_POOL_2D", "MUL", "RELU", "RELU_N1_TO_1", "RELU6", "RESHAPE",
+    "RESIZE_BILINEAR", "RNN", "SOFTMAX", "SPACE_TO_DEPTH", "SVDF", "TANH",
+    "CONCAT_EMBEDDINGS", "SKIP_GRAM", "CALL", "CUSTOM",
+    "EMBEDDING_LOOKUP_SPARSE", "PAD", "UNIDIRECTIONAL_SEQUENCE_RNN", "GATHER",
+    "BATCH_TO_SPACE_ND", "SPACE_TO_BATCH_ND", "TRANSPOSE", "MEAN", "SUB",
+    "DIV", "SQUEEZE", "UNIDIRECTIONAL_SEQUENCE_LSTM", "STRIDED_SLICE",
+    "BIDIRECTIONAL_SEQUENCE_RNN", "EXP", "TOPK_V2", "SPLIT", "LOG_SOFTMAX",
+    "DELEGATE", "BIDIRECTIONAL_SEQUENCE_LSTM", "CAST", "PRELU", "MAXIMUM",
+    "ARG_MAX", "MINIMUM", "LESS", "NEG", "PADV2", "GREATER", "GREATER_EQUAL",
+    "LESS_EQUAL", "SELECT", "SLICE", "SIN", "TRANSPOSE_CONV",
+    "SPARSE_TO_DENSE", "TILE", "EXPAND_DIMS", "EQUAL", "NOT_EQUAL", "LOG",
+    "SUM", "SQRT", "RSQRT", "SHAPE", "POW", "ARG_MIN", "FAKE_QUANT",
+    "REDUCE_PROD", "REDUCE_MAX", "PACK", "LOGICAL_OR", "ONE_HOT",
+    "LOGICAL_AND", "UNPACK", "REDUCE_MIN", "FLOOR_DIV", "REDUCE_ANY",
+    "SQUARE", "ZEROS_LIKE", "FILL", "FLOOR_MOD", "RANGE",
+    "RESIZE_NEAREST_NEIGHBOR", "LEAKY_RELU", "SQUARED_DIFFERENCE",
+    "MIRROR_PAD", "ABS", "SPLIT_V", "UNIQUE", "CEIL", "REVERSE_V2", "ADD_N",
+    "GATHER_ND", "COS", "WHERE", "RANK", "ELU", "REVERSE_SEQUENCE",
+    "MATRIX_DIAG", "QUANTIZE", "MATRIX_SET_DIAG", "ROUND", "HARD_SWISH", "IF",
+    "WHILE", "NON_MAX_SUPPRESSION_V4", "NON_MAX_SUPPRESSION_V5", "SCATTER_ND",
+    "SELECT_V2", "DENSIFY", "SEGMENT_SUM", "BATCH_MATMUL"]
+
+# Bytes per element of TensorType, 0 for the ones without a fixed size
+TYPE_BYTES = [4, 2, 4, 1, 8, 0, 1, 2, 8, 1, 8, 16, 8, 0, 0, 4, 2, 0.5]
+
+# Operators that do one operation per output element, counted as one MAC
+ELEMENTWISE = ["ADD", "SUB", "MUL", "DIV", "MAXIMUM", "MINIMUM", "RELU",
+               "RELU6", "RELU_N1_TO_1", "LOGISTIC", "TANH", "PRELU",
+               "LEAKY_RELU", "HARD_SWISH", "ELU", "EXP", "LOG", "SQRT",
+               "RSQRT", "SQUARE", "SQUARED_DIFFERENCE", "ABS", "NEG",
+               "SOFTMAX", "LOG_SOFTMAX", "QUANTIZE", "DEQUANTIZE", "POW"]
+
+# Read only view of one flatbuffer table
+class Table:
+    def __init__(self, buf, pos):
+        self.buf = buf
+        self.pos = pos
+        self.vtable = pos - struct.unpack_from("<i", buf, pos)[0]
+        self.vsize = struct.unpack_from("<H", buf, self.vtable)[0]
+
+    # Absolute position of field i, None when it is not set
+    def field(self, i):
+        off = 4 + 2 * i
+        if off >= self.vsize:
+            return None
+        o = struct.unpack_from("<H", self.buf, self.vtable + off)[0]
+        if o == 0:
+            return None
+        return self.pos + o
+
+    def scalar(self, i, fmt, default=0):
+        p = self.field(i)
+        if p is None:
+            return default
+        return struct.unpack_from(fmt, self.buf, p)[0]
+
+    def indirect(self, i):
+        p = self.field(i)
+        if p is None:
+            return None
+        return p + struct.unpack_from("<I", self.buf, p)[0]
+
+    def table(self, i):
+        p = self.indirect(i)
+        if p is None:
+            return None
+        return Table(self.buf, p)
+
+    # Position of the first element and length of a vector
+    def vector(self, i):
+        p = self.indirect(i)
+        if p is None:
+            return None, 0
+        return p + 4, struct.unpack_from("<I", self.buf, p)[0]
+
+    def ints(self, i, fmt="<i"):
+        start, n = self.vector(i)
+        if start is None:
+            return []
+        return list(struct.unpack_from("<" + fmt[-1] * n, self.buf, start))
+
+    def tables(self, i):
+        start, n = self.vector(i)
+        res = []
+        for k in range(n):
+            p = start + 4 * k
+            res.append(Table(self.buf, p + struct.unpack_from("<I", self.buf,
+                                                              p)[0]))
+        return res
+
+    def string(self, i):
+        start, n = self.vector(i)
+        if start is None:
+            return None
+        return self.buf[start:start + n].decode('utf-8', errors='replace')
+
+def op_name(code):
+    # builtin_code replaced deprecated_builtin_code, which stops at 127
+    builtin = max(code.scalar(3, "<i"), code.scalar(0, "<b"))
+    if builtin == 32:
+        return code.string(1) or "CUSTOM"
+    if builtin < len(BUILTIN_OPS):
+        return BUILTIN_OPS[builtin]
+    return "BUILTIN_" + str(builtin)
+
+def elements(shape):
+    n = 1
+    for d in shape:
+        n = n * max(d, 1)
+    return n
+
+# Tensors of the main subgraph: name, shape, bytes and whether they are
+# constant
+def read_tensors(graph, buffers):
+    res = []
+    for t in graph.tables(0):
+        shape = t.ints(0)
+        ttype = t.scalar(1, "<b")
+        size = TYPE_BYTES[ttype] if ttype < len(TYPE_BYTES) else 0
+        buf = t.scalar(2, "<I")
+        const = False
+        if 0 < buf < len(buffers):
+            start, n = buffers[buf].vector(0)
+            const = n > 0 or buffers[buf].scalar(2, "<Q") > 0
+        res.append({"name": t.string(3), "shape": shape,
+                    "bytes": int(elements(shape) * size), "const": const})
+    return res
+
+def macs(name, inputs, outputs, options):
+    if len(outputs) == 0:
+        return 0
+    out = outputs[0]["shape"]
+    n_out = elements(out)
+    if name == "CONV_2D" and len(inputs) > 1:
+        f = inputs[1]["shape"]
+        return n_out * elements(f[1:])
+    if name == "DEPTHWISE_CONV_2D" and len(inputs) > 1:
+        f = inputs[1]["shape"]
+        return n_out * elements(f[1:3])
+    if name == "TRANSPOSE_CONV" and len(inputs) > 2:
+        f = inputs[1]["shape"]
+        return elements(inputs[2]["shape"]) * elements(f[:3])
+    if name == "FULLY_CONNECTED" and len(inputs) > 1:
+        return n_out * inputs[1]["shape"][-1]
+    if name == "BATCH_MATMUL" and len(inputs) > 0:
+        return n_out * inputs[0]["shape"][-1]
+    if name in ["AVERAGE_POOL_2D", "MAX_POOL_2D", "L2_POOL_2D"]:
+        # Pool2DOptions: filter_width and filter_height
+        if options is not None:
+            return n_out * options.scalar(3, "<i", 1) * options.scalar(4, "<i", 1)
+        return n_out
+    if name in ["MEAN", "SUM", "REDUCE_MAX", "REDUCE_MIN", "REDUCE_PROD"]:
+        return elements(inputs[0]["shape"]) if len(inputs) > 0 else 0
+    if name in ["RESIZE_BILINEAR"]:
+        # Four input pixels per output element
+        return n_out * 4
+    if name in ELEMENTWISE:
+        return n_out
+    return 0
+
+# Cost of every operator of the main subgraph, in execution order
+def analyze(path):
+    with open(path, "rb") as f:
+        buf = f.read()
+    model = Table(buf, struct.unpack_from("<I", buf, 0)[0])
+    codes = model.tables(1)
+    graph = model.tables(2)[0]
+    tensors = read_tensors(graph, model.tables(4))
+    ops = []
+    for i, op in enumerate(graph.tables(3)):
+        name = op_name(codes[op.scalar(0, "<I")])
+        inputs = [tensors[k] for k in op.ints(1) if k >= 0]
+        outputs = [tensors[k] for k in op.ints(2) if k >= 0]
+        params = sum(t["bytes"] for t in inputs if t["const"])
+        acts = sum(t["bytes"] for t in inputs if not t["const"])
+        acts = acts + sum(t["bytes"] for t in outputs)
+        ops.append({"index": i, "op": name,
+                    "output": outputs[0]["name"] if len(outputs) > 0 else None,
+                    "macs": macs(name, inputs, outputs, op.table(4)),
+                    "param_bytes": params, "activation_bytes": acts})
+    return ops
+
+# Measured ms of every operator. benchmark_model names the rows after the
+# output tensor of the operator, when the names do not match the rows are
+# taken in run order if they have the same types.
+def join_times(ops, times):
+    by_name = {}
+    for t in times:
+        by_name.setdefault(t.get("name"), []).append(t["time"])
+    if all(op["output"] in by_name for op in ops):
+        return [by_name[op["output"]].pop(0) for op in ops]
+    if len(times) == len(ops) and all(t["layer"] == op["op"]
+                                      for t, op in zip(times, ops)):
+        return [t["time"] for t in times]
+    return None
+
+# Achieved GMAC/s and GB/s of every operator of a configuration, plus the
+# fraction of the roofline when the peaks of the device are given
+def rates(ops, ms, peak_gmacs=None, peak_gbs=None):
+    res = []
+    for op, t in zip(ops, ms):
+        r = dict(op, time=t, gmacs=None, gbs=None)
+        moved = op["param_bytes"] + op["activation_bytes"]
+        if t > 0:
+            r["gmacs"] = op["macs"] / t / 1e6
+            r["gbs"] = moved / t / 1e6
+        if peak_gmacs and peak_gbs and t > 0 and moved > 0:
+            roof = min(peak_gmacs, op["macs"] / moved * peak_gbs)
+            if roof > 0:
+                r["roofline"] = r["gmacs"] / roof
+        res.append(r)
+    return res
+
+def totals(rows):
+    t = sum(r["time"] for r in rows)
+    m = sum(r["macs"] for r in rows)
+    b = sum(r["param_bytes"] + r["activation_bytes"] for r in rows)
+    if t == 0:
+        return {"time": 0.0, "gmacs": None, "gbs": None}
+    return {"time": t, "gmacs": m / t / 1e6, "gbs": b / t / 1e6}
+
+def fmt(v, f):
+    if v is None:
+        return "-"
+    return f % v
+
+def print_ops(ops):
+    print("%4s %-24s %14s %12s %12s  %s" % ("#", "op", "MACs", "param B",
+                                            "act B", "output"))
+    for op in ops:
+        print("%4d %-24s %14d %12d %12d  %s" % (
+            op["index"], op["op"], op["macs"], op["param_bytes"],
+            op["activation_bytes"], op["output"]))
+    print("Total %.3f GMACs, %.2f MB of parameters" % (
+        sum(op["macs"] for op in ops) / 1e9,
+        sum(op["param_bytes"] for op in ops) / 1e6))
+
+def print_rates(name, rows):
+    print(name)
+    print("%4s %-24s %10s %10s %10s %9s" % ("#", "op", "ms", "GMAC/s",
+                                            "GB/s", "roofline"))
+    for r in rows:
+        roof = "-"
+        if "roofline" in r:
+            roof = "%.1f%%" % (r["roofline"] * 100)
+        print("%4d %-24s %10.3f %10s %10s %9s" % (
+            r["index"], r["op"], r["time"], fmt(r["gmacs"], "%.2f"),
+            fmt(r["gbs"], "%.2f"), roof))
+    t = totals(rows)
+    print("Total %.3f ms, %s GMAC/s, %s GB/s" % (
+        t["time"], fmt(t["gmacs"], "%.2f"), fmt(t["gbs"], "%.2f")))
+
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(
+        description="Static cost model of a tflite model")
+    parser.add_argument('model', help="tflite model")
+    parser.add_argument('results', nargs='?',
+                        help="results of the testbench to join with")
+    parser.add_argument('--workload', help="only this workload of the results")
+    parser.add_argument('--peak-gmacs', type=float,
+                        help="peak GMAC/s of the device")
+    parser.add_argument('--peak-gbs', type=float,
+                        help="peak memory bandwidth of the device in GB/s")
+    parser.add_argument('--output', help="json file with the full report")
+    return parser.parse_args(args[1:])
+
+def main(args):
+    args = parse_arguments(args)
+    for fil in [args.model, args.results]:
+        if fil is not None and not os.path.isfile(fil):
+            print("Error: File not found " + fil)
+            return 128
+    ops = analyze(args.model)
+    report = {"ops": ops, "configs": []}
+    if args.results is None:
+        print_ops(ops)
+    else:
+        data = compact.load(args.results)
+        for name, entries in data.items():
+            if args.workload is not None and name != args.workload:
+                continue
+            for entry in entries:
+                label = name + " " + entry["type"]
+                if entry.get("device") is not None:
+                    label = label + " (" + entry["device"] + ")"
+                ms = join_times(ops, entry.get("times", []))
+                if ms is None:
+                    print("Warning: the layers of " + label
+                          + " do not match the model")
+                    continue
+                rows = rates(ops, ms, args.peak_gmacs, args.peak_gbs)
+                print_rates(label, rows)
+                report["configs"].append({"workload": name,
+                                          "type": entry["type"],
+                                          "device": entry.get("device"),
+                                          "total": totals(rows),
+                                          "ops": rows})
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -25,6 +25,12 @@ var dialog = app.dialog;
 var fs = require('fs');
 
 var Edata = null;
+// Compact results file: descriptor, interned strings, format version and
+// start of the data
+var Efile = null;
+var Estrings = null;
+var Eversion = 1;
+var EdataOffset = 0;
 var selModel = document.getElementById("listModels");
 var selOption = document.getElementById("listOptions");
 var selModel2 = document.getElementById("listModels2");
@@ -43,6 +49,14 @@ buttOpen.addEventListener('click', function () {
     }
 
     fileName = fileNames[0]
+    if (Efile != null) {
+        fs.closeSync(Efile);
+        Efile = null;
+    }
+    if (openCompact(fileName)) {
+        loadData();
+        return;
+    }
     fs.readFile(fileName, 'utf-8', (err, data) => {
         if(err){
             alert("An error ocurred reading the file :" + err.message);
@@ -54,6 +68,76 @@ buttOpen.addEventListener('click', function () {
     });
 });
 
+// Reads only the summary of a compact file, the per layer times of each
+// configuration are read when it is plotted
+function openCompact(fileName) {
+    var fd = fs.openSync(fileName, 'r');
+    var head = Buffer.alloc(8);
+    fs.readSync(fd, head, 0, 8, 0);
+    if (head.toString('latin1', 0, 4) != "TBC1") {
+        fs.closeSync(fd);
+        return false;
+    }
+    var n = head.readUInt32LE(4);
+    var raw = Buffer.alloc(n);
+    fs.readSync(fd, raw, 0, n, 8);
+    var summary = JSON.parse(raw.toString('utf-8'));
+    Efile = fd;
+    Estrings = summary["strings"];
+    Eversion = summary["version"];
+    EdataOffset = 8 + n + (8 - (8 + n) % 8) % 8;
+    Edata = summary["workloads"];
+    return true;
+}
+
+function readArray(block, type) {
+    var ab = new ArrayBuffer(block[1]);
+    if (block[1] > 0) {
+        fs.readSync(Efile, new Uint8Array(ab), 0, block[1],
+                    EdataOffset + block[0]);
+    }
+    return new type(ab);
+}
+
+// Per layer times of a configuration, read from the compact file the first
+// time they are needed
+function layerTimes(k) {
+    if (k["times"] == null && k["detail"] != null) {
+        var layer = readArray(k["detail"]["layer"], Int32Array);
+        var name = readArray(k["detail"]["name"], Int32Array);
+        // Version 1 files stored the times as floats
+        var time = readArray(k["detail"]["time"],
+                             Eversion >= 2 ? Float64Array : Float32Array);
+        var times = [];
+        for (var i = 0; i < time.length; i++) {
+            var t = {"layer": Estrings[layer[i]], "time": time[i]};
+            if (name[i] >= 0) t["name"] = Estrings[name[i]];
+            times.push(t);
+        }
+        k["times"] = times;
+    }
+    return k["times"];
+}
+
+// Time per layer type, precomputed in the compact files
+function layerTotals(k) {
+    var ls = {};
+    if (k["type_totals"] != null) {
+        k["type_totals"].forEach(function (t) {
+            ls[Estrings[t[0]]] = t[1];
+        });
+        return ls;
+    }
+    layerTimes(k).forEach(function (t) {
+        if (t["layer"] in ls) {
+            ls[t["layer"]] = ls[t["layer"]] + t["time"];
+        } else {
+            ls[t["layer"]] = t["time"];
+        }
+    });
+    return ls;
+}
+
 function loadData() {
     selModel.options.length = 0;
     selModel2.options.length = 0;
@@ -76,6 +160,15 @@ function loadData() {
     plotData();
 }
 
+// Results from several devices carry the serial of the device and the
+// throttled ones are flagged
+function typeLabel(k) {
+    var label = k["type"];
+    if (k["device"] != null) label += " (" + k["device"] + ")";
+    if (k["throttled"]) label += " [throttled]";
+    return label;
+}
+
 function populOption() {
     if (Edata == null) return;
     l = Edata[selModel.value];
@@ -84,7 +177,7 @@ function populOption() {
     console.log(l)
     l.forEach(function(k, i, a) {
         var option = document.createElement("OPTION");
-        option.innerHTML = k["type"];
+        option.innerHTML = typeLabel(k);
         option.value = i;
         selOption.options.add(option);
     })
@@ -98,7 +191,7 @@ function populOption2() {
     console.log(l)
     l.forEach(function(k, i, a) {
         var option = document.createElement("OPTION");
-        option.innerHTML = k["type"];
+        option.innerHTML = typeLabel(k);
         option.value = i;
         selOption2.options.add(option);
     })
@@ -126,12 +219,27 @@ Number.prototype.pad = function(size) {
     return s;
 }
 
+// Mean time plus the percentiles when the raw samples were recorded
+function timeText(k) {
+    var st = "Mean execution time: "+k["mean_time"]+"ms";
+    if (k["p50"] != null) {
+        st += " p50: "+k["p50"].toFixed(3)+"ms p90: "+k["p90"].toFixed(3)
+            +"ms p99: "+k["p99"].toFixed(3)+"ms ("+k["count"]+" samples)";
+    }
+    if (k["init_time"] != null) {
+        st += " Init: "+k["init_time"].toFixed(3)+"ms";
+    }
+    if (k["memory"] != null && k["memory"]["peak_rss_kb"] != null) {
+        st += " Peak RSS: "+(k["memory"]["peak_rss_kb"]/1024).toFixed(1)+"MB";
+    }
+    return st;
+}
+
 function plotData() {
     tpl = document.getElementById('timperlayer');
     model = selModel.value;
     type = selOption.value;
-    tavg = Edata[model][type]["mean_time"];
-    textTime.innerText = "Mean execution time: "+tavg+"ms";
+    textTime.innerText = timeText(Edata[model][type]);
     Plotly.purge(tpl);
     timperlayer(model, type);
     timlayer(model, type);
@@ -139,8 +247,7 @@ function plotData() {
     model = selModel2.value;
     type = selOption2.value;
     if (Edata[model] != null) {
-        tavg = Edata[model][type]["mean_time"];
-        textTime2.innerText = "Mean execution time: "+tavg+"ms";
+        textTime2.innerText = timeText(Edata[model][type]);
         timperlayer(model, type);
     } else {
         textTime2.innerText = "";
@@ -153,16 +260,7 @@ function timlayer (model, type) {
     Plotly.purge(tpl);
     Plotly.purge(tpl2);
     console.log("Model: "+model+" Type: "+type);
-    times = Edata[model][type]["times"];
-    ls = {};
-    times.forEach(function (k,i,o) {
-        l=k["layer"]; t=k["time"];
-        if (l in ls) {
-            ls[l] = ls[l]+t;
-        } else {
-            ls[l] = t;
-        }
-    })
+    ls = layerTotals(Edata[model][type]);
     x = []; y = []
     k = Object.keys(ls);
     k.forEach(function (q, i, d) {
@@ -189,7 +287,7 @@ function timlayer (model, type) {
     x = []; y = [];
     l = Edata[selModel.value];
     l.forEach(function(k,i,o) {
-        x.push(k["type"]);
+        x.push(typeLabel(k));
         y.push(k["mean_time"]);
     })
     Plotly.plot(tpl2, [{
@@ -214,14 +312,14 @@ function timlayer (model, type) {
 function timperlayer (model, type) {
     tpl = document.getElementById('timperlayer');
     console.log("Model: "+model+" Type: "+type);
-    times = Edata[model][type]["times"];
+    times = layerTimes(Edata[model][type]);
     x = []; y = []
     times.forEach(function (k, i, d) {
         x.push(k["layer"]+"_"+(i).pad());
         y.push(k["time"])
     });
     Plotly.plot(tpl, [{
-        x: x, y:y, type: 'bar', name: model+" "+Edata[model][type]["type"]
+        x: x, y:y, type: 'bar', name: model+" "+typeLabel(Edata[model][type])
     }], {
         margin: {t: 50, b: -50},
         title: {
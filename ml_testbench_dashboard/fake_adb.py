@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019, ARM Limited and Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Stand in for adb that runs everything on the host. Each device is a folder
+# under FAKE_ADB_ROOT and /data/local/tmp is mapped inside of it.
+# Usage: ADB=./fake_adb.py ./testbench.py test.yaml
+
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+ROOT = os.environ.get("FAKE_ADB_ROOT", "/tmp/fake_adb")
+DEVICES = os.environ.get("FAKE_ADB_DEVICES", "fake0").split(",")
+DEVICE_PATH = "/data/local/tmp"
+
+def device_root(serial):
+    return os.path.join(ROOT, serial)
+
+def rewrite(st, serial):
+    return st.replace(DEVICE_PATH, device_root(serial) + DEVICE_PATH)
+
+# Copies the output of the shell hiding the host folder of the device
+def forward(stream, serial):
+    root = device_root(serial).encode('utf-8')
+    for line in stream:
+        sys.stdout.buffer.write(line.replace(root, b""))
+        sys.stdout.buffer.flush()
+
+def shell(args, serial):
+    os.makedirs(device_root(serial) + DEVICE_PATH, exist_ok=True)
+    if len(args) > 0:
+        p = subprocess.Popen(["sh", "-c", rewrite(" ".join(args), serial)],
+                             stdout=subprocess.PIPE)
+        forward(p.stdout, serial)
+        return p.wait()
+    # Interactive session, the paths are rewritten line by line
+    p = subprocess.Popen(["sh"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    out = threading.Thread(target=forward, args=(p.stdout, serial))
+    out.start()
+    for line in sys.stdin.buffer:
+        p.stdin.write(rewrite(line.decode('utf-8'), serial).encode('utf-8'))
+        p.stdin.flush()
+    p.stdin.close()
+    out.join()
+    return p.wait()
+
+def push(args, serial):
+    if len(args) < 2:
+        print("adb: push requires an argument", file=sys.stderr)
+        return 1
+    remote = rewrite(args[-1], serial)
+    for local in args[:-1]:
+        dest = remote
+        if os.path.isdir(remote) or remote.endswith("/"):
+            os.makedirs(remote, exist_ok=True)
+            dest = os.path.join(remote, os.path.basename(local))
+        else:
+            os.makedirs(os.path.dirname(remote), exist_ok=True)
+        shutil.copy(local, dest)
+    return 0
+
+def main(args):
+    serial = DEVICES[0]
+    if len(args) > 2 and args[1] == "-s":
+        serial = args[2]
+        args = args[:1] + args[3:]
+    if len(args) < 2:
+        print("Usage: fake_adb.py [-s serial] shell|push|devices ...")
+        return 1
+    if args[1] == "devices":
+        print("List of devices attached")
+        for d in DEVICES:
+            print(d + "\tdevice")
+        return 0
+    if args[1] == "shell":
+        return shell(args[2:], serial)
+    if args[1] == "push":
+        return push(args[2:], serial)
+    print("fake_adb: unknown command " + args[1], file=sys.stderr)
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
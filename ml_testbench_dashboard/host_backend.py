@@ -0,0 +1,148 @@
+# Copyright (c) 2019, ARM Limited and Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Host backend: runs the workloads in this process with the TFLite python
+# interpreter, so models can be measured on a plain Linux machine without a
+# device. The python interpreter has no op profiler, the per layer times come
+# from a host build of benchmark_model when there is one in HOST_BENCH_BIN.
+
+import numpy as np
+import os
+import platform
+from parsers import TFLiteParser
+import subprocess
+import time
+
+# (Interpreter class, runtime name), both None without a runtime. Imported on
+# first use, TensorFlow takes seconds to import and only host jobs need it.
+RUNTIME = None
+
+def runtime():
+    global RUNTIME
+    if RUNTIME is not None:
+        return RUNTIME
+    try:
+        import tensorflow as tf
+        RUNTIME = (tf.lite.Interpreter, "tensorflow " + tf.__version__)
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+            import tflite_runtime
+            RUNTIME = (Interpreter, "tflite_runtime " + tflite_runtime.__version__)
+        except ImportError:
+            RUNTIME = (None, None)
+    return RUNTIME
+
+HOST_BENCH_BIN = os.path.join("host_binaries", "benchmark_model")
+
+# Random tensor for an input of the model, the same on every run
+def input_tensor(detail, rng):
+    shape = detail['shape']
+    dtype = np.dtype(detail['dtype'])
+    if dtype.kind == 'f':
+        return rng.standard_normal(shape).astype(dtype)
+    if dtype.kind == 'b':
+        return rng.integers(0, 2, shape).astype(dtype)
+    info = np.iinfo(dtype)
+    return rng.integers(max(info.min, -128), min(info.max, 127) + 1,
+                        shape).astype(dtype)
+
+# Interpreter ready to invoke and the ms it took to load it
+def load(model, threads):
+    Interpreter = runtime()[0]
+    if Interpreter is None:
+        print("Error: The host backend needs tensorflow or tflite_runtime")
+        return None, None
+    start = time.perf_counter()
+    try:
+        interp = Interpreter(model_path=model, num_threads=threads)
+        interp.allocate_tensors()
+    except (ValueError, RuntimeError) as e:
+        print("Error loading " + model + " on the host: " + str(e))
+        return None, None
+    init_ms = (time.perf_counter() - start) * 1000.0
+    rng = np.random.default_rng(0)
+    for detail in interp.get_input_details():
+        interp.set_tensor(detail['index'], input_tensor(detail, rng))
+    return interp, init_ms
+
+# VmHWM and VmRSS of this process in kB
+def read_rss():
+    res = {}
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    res["peak_rss_kb"] = int(line.split()[1])
+                elif line.startswith("VmRSS:"):
+                    res["rss_kb"] = int(line.split()[1])
+    except OSError:
+        pass
+    return res
+
+# Resets the peak RSS of the process to the current one, which is returned
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+    return read_rss().get("rss_kb")
+
+# Milliseconds of one inference
+def invoke(interp):
+    start = time.perf_counter()
+    interp.invoke()
+    return (time.perf_counter() - start) * 1000.0
+
+# Per layer times of runs inferences with the host benchmark_model, None when
+# it is not available
+def profile_ops(model, threads, runs):
+    if not os.path.isfile(HOST_BENCH_BIN):
+        return None
+    parser = TFLiteParser()
+    process = subprocess.Popen([HOST_BENCH_BIN, "--graph=" + model,
+                                "--num_runs=" + str(runs),
+                                "--num_threads=" + str(threads),
+                                "--enable_op_profiling=true"],
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL)
+    for line in process.stdout:
+        parser.feed(line)
+    if process.wait() != 0:
+        print("Error profiling " + model + " on the host")
+        return None
+    return parser.result().layer_times()
+
+# CPU model and machine of the host, the device part of the key
+def fingerprint():
+    cpu = platform.processor()
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    cpu = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return {"machine": platform.machine(), "system": platform.system(),
+            "cpu": cpu, "cores": os.cpu_count()}
@@ -0,0 +1,85 @@
+# Copyright (c) 2019, ARM Limited and Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Journal of finished jobs, one JSON line per job written to disk as soon as
+# the job finishes, so a run that dies can be resumed.
+
+import json
+import os
+import threading
+
+def journal_path(outfile):
+    return os.path.splitext(outfile)[0] + ".jsonl"
+
+# Records of the journal and the length of the file they take. Reading
+# stops at the first line cut by a crash.
+def read(path):
+    records = []
+    length = 0
+    if not os.path.isfile(path):
+        return records, length
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            length += len(line)
+    return records, length
+
+def load(path):
+    return read(path)[0]
+
+class Journal:
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        if resume and os.path.isfile(path):
+            # A cut last line is dropped, the new records would land behind
+            # it and be lost on the next resume
+            self.f = open(path, "r+")
+            self.f.truncate(read(path)[1])
+            self.f.seek(0, os.SEEK_END)
+        else:
+            self.f = open(path, "w")
+
+    def append(self, record):
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            self.f.write(line)
+            self.f.flush()
+            os.fsync(self.f.fileno())
+
+    def close(self):
+        self.f.close()
+
+# Writes the file aside and renames it, the old file stays until the new one
+# is complete
+def write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
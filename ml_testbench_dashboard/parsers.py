@@ -0,0 +1,320 @@
+# Copyright (c) 2019, ARM Limited and Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Incremental parsers for the output of benchmark_model and ExecuteNetwork.
+# Both get the output one line at a time through feed(), so they can be
+# plugged straight into the stdout of the process and never keep it whole.
+
+from dataclasses import dataclass, field
+import json
+import re
+from typing import List, Optional
+
+RE_INIT = re.compile(r"Initialized session in ([\d.]+)\s*ms")
+RE_PAIR = re.compile(r"([A-Za-z][A-Za-z ]*): ([-\d.e+]+)")
+RE_ASSIGN = re.compile(r"(\w+)=([-\d.e+]+)")
+RE_COUNTER = re.compile(r"_#\d+$")
+RE_STATUS = re.compile(r"^(Vm\w+):\s*(\d+) kB")
+RE_ARENA = re.compile(r"(kTfLite\w+): (\d+) bytes")
+RE_LOAD = re.compile(r"(Initialization|Optimization) time: ([\d.]+)\s*ms")
+
+@dataclass
+class RunStats:
+    # All the times in us
+    count: int
+    first: float
+    curr: float
+    min: float
+    max: float
+    avg: float
+    std: float
+
+@dataclass
+class OpTime:
+    node_type: str
+    name: str
+    first_ms: float
+    avg_ms: float
+    percent: float
+    mem_kb: float
+    times_called: int
+
+@dataclass
+class NodeTypeStats:
+    node_type: str
+    count: int
+    avg_ms: float
+    percent: float
+    mem_kb: float
+    times_called: int
+
+@dataclass
+class TFLiteResult:
+    init_ms: Optional[float] = None
+    warmup: Optional[RunStats] = None
+    steady: Optional[RunStats] = None
+    # "Average inference timings" line, in us
+    averages: dict = field(default_factory=dict)
+    # {"peak": {"init": MB, "overall": MB}, "delta": {...}}
+    memory: dict = field(default_factory=dict)
+    init_ops: List[OpTime] = field(default_factory=list)
+    ops: List[OpTime] = field(default_factory=list)
+    node_types: List[NodeTypeStats] = field(default_factory=list)
+    nodes_observed: Optional[int] = None
+
+    # Per layer times in the schema of the result files
+    def layer_times(self):
+        return [{"layer": op.node_type, "name": op.name, "time": op.avg_ms}
+                for op in self.ops]
+
+    def mean_time(self):
+        return sum(op.avg_ms for op in self.ops)
+
+@dataclass
+class ArmNNIteration:
+    wall_ms: float
+    layers: List[dict] = field(default_factory=list)
+
+    def layer_times(self):
+        return self.layers
+
+@dataclass
+class MemoryStats:
+    # Last VmHWM and VmRSS read from /proc/<pid>/status, in kB
+    peak_rss_kb: Optional[int] = None
+    rss_kb: Optional[int] = None
+    # Bytes by memory type of the interpreter (kTfLiteArenaRw...)
+    arena: dict = field(default_factory=dict)
+    # ExecuteNetwork initialization and optimization times in ms
+    load_ms: dict = field(default_factory=dict)
+
+def to_float(st):
+    return float(st.rstrip('%'))
+
+def to_str(line):
+    if isinstance(line, bytes):
+        return line.decode('ascii', errors='replace')
+    return line
+
+class TFLiteParser:
+    def __init__(self):
+        self.res = TFLiteResult()
+        self.counts = []
+        # Which profiling block and which table of it we are reading
+        self.section = "run"
+        self.table = None
+        self.columns = None
+
+    def feed(self, line):
+        line = to_str(line).rstrip('\r\n')
+        if len(line) == 0:
+            self.table = None
+            return
+        if line[0] == '\t' and self.table is not None:
+            self.feed_row(line)
+            return
+        if line[0] == '=':
+            self.start_table(line)
+            return
+        self.table = None
+        if line.startswith("count="):
+            self.counts.append(parse_run_stats(line))
+        elif line.startswith("Initialized session"):
+            m = RE_INIT.search(line)
+            if m:
+                self.res.init_ms = float(m.group(1))
+        elif line.startswith("Average inference timings"):
+            self.section = "run"
+            pairs = RE_PAIR.findall(line.split(":", 1)[1])
+            self.res.averages = {k.strip(): float(v) for k, v in pairs}
+        elif line.startswith("Profiling Info for Benchmark Initialization"):
+            self.section = "init"
+        elif line.startswith("Operator-wise Profiling Info"):
+            self.section = "run"
+        elif line.startswith("Peak memory footprint"):
+            self.res.memory["peak"] = parse_assign(line)
+        elif line.startswith("Memory footprint delta"):
+            self.res.memory["delta"] = parse_assign(line)
+        elif line.endswith("nodes observed"):
+            self.res.nodes_observed = int(line.split()[0])
+
+    def start_table(self, line):
+        self.columns = None
+        if "Run Order" in line:
+            self.table = "order"
+        elif "Summary by node type" in line:
+            self.table = "types"
+        else:
+            self.table = None
+
+    def feed_row(self, line):
+        row = [x.strip() for x in line.split('\t') if x.strip()]
+        if self.columns is None:
+            self.columns = [c.strip('[]').lower() for c in row]
+            return
+        if len(row) != len(self.columns):
+            return
+        r = dict(zip(self.columns, row))
+        if self.table == "order":
+            op = OpTime(node_type=r.get("node type", ""),
+                        name=r.get("name", "").strip('[]'),
+                        first_ms=to_float(r.get("first", "0")),
+                        avg_ms=to_float(r.get("avg ms", "0")),
+                        percent=to_float(r.get("%", "0")),
+                        mem_kb=to_float(r.get("mem kb", "0")),
+                        times_called=int(r.get("times called", "1")))
+            if self.section == "init":
+                self.res.init_ops.append(op)
+            else:
+                self.res.ops.append(op)
+        elif self.table == "types" and self.section == "run":
+            self.res.node_types.append(
+                NodeTypeStats(node_type=r.get("node type", ""),
+                              count=int(r.get("count", "0")),
+                              avg_ms=to_float(r.get("avg ms", "0")),
+                              percent=to_float(r.get("avg %", "0")),
+                              mem_kb=to_float(r.get("mem kb", "0")),
+                              times_called=int(r.get("times called", "0"))))
+
+    def result(self):
+        # The first count= line is the warmup, the last one the steady
+        # state. A line with missing fields is None.
+        if len(self.counts) > 0:
+            self.res.steady = self.counts[-1]
+        if len(self.counts) > 1:
+            self.res.warmup = self.counts[0]
+        return self.res
+
+def parse_assign(line):
+    return {k: float(v) for k, v in RE_ASSIGN.findall(line)}
+
+# When every run took the same time (always with a single run) TFLite prints
+# only count= and curr=. None when any other field is missing.
+def parse_run_stats(line):
+    f = parse_assign(line)
+    if "count" not in f or "curr" not in f:
+        return None
+    if set(f.keys()) == {"count", "curr"}:
+        c = f["curr"]
+        return RunStats(count=int(f["count"]), first=c, curr=c, min=c, max=c,
+                        avg=c, std=0.0)
+    try:
+        return RunStats(count=int(f["count"]), first=f["first"], curr=f["curr"],
+                        min=f["min"], max=f["max"], avg=f["avg"], std=f["std"])
+    except KeyError:
+        return None
+
+def parse_tflite(lines):
+    p = TFLiteParser()
+    for line in lines:
+        p.feed(line)
+    return p.result()
+
+# Takes the memory lines out of the output and gives the rest to the parser
+# of the benchmark
+class MemoryParser:
+    def __init__(self, inner):
+        self.inner = inner
+        self.res = MemoryStats()
+
+    def feed(self, line):
+        st = to_str(line)
+        m = RE_STATUS.match(st)
+        if m:
+            if m.group(1) == "VmHWM":
+                self.res.peak_rss_kb = int(m.group(2))
+            elif m.group(1) == "VmRSS":
+                self.res.rss_kb = int(m.group(2))
+            return
+        m = RE_ARENA.search(st)
+        if m:
+            self.res.arena[m.group(1)] = int(m.group(2))
+            return
+        m = RE_LOAD.search(st)
+        if m:
+            self.res.load_ms[m.group(1).lower()] = float(m.group(2))
+        self.inner.feed(line)
+
+    def result(self):
+        return self.res
+
+# Collects the lines of the JSON profile, which is decoded once at the end
+class ArmNNParser:
+    def __init__(self):
+        self.chunks = []
+        self.depth = 0
+
+    def feed(self, line):
+        line = to_str(line).rstrip('\r\n')
+        if len(line) == 0:
+            return
+        if line[0] == '{':
+            self.depth = self.depth + 1
+        if self.depth != 0:
+            self.chunks.append(line)
+        if line[0] == '}':
+            self.depth = self.depth - 1
+
+    # One ArmNNIteration per Execute_#N block, None if there are none
+    def result(self):
+        if len(self.chunks) == 0:
+            return None
+        data = json.loads("".join(self.chunks))["ArmNN"]
+        k = list(data.keys())
+        if len(k) > 1:
+            print("There is more than 1 run")
+        data = data[k[0]]
+        out = []
+        for k in data.keys():
+            if k.startswith("Execute_#"):
+                it = parse_execute(data[k])
+                if it is not None:
+                    out.append(it)
+        if len(out) == 0:
+            print("Execution not found")
+            return None
+        return out
+
+def parse_execute(data):
+    wall = None
+    layers = []
+    for k, ent in data.items():
+        if not isinstance(ent, dict):
+            continue
+        if k.startswith("Wall clock time"):
+            if k.startswith("Wall clock time_#"):
+                wall = ent["raw"][0] / 1000.0
+            continue
+        raws = [v for v in ent.values() if isinstance(v, dict) and "raw" in v]
+        if len(raws) > 0:
+            # Drop the event counter so the names match between iterations
+            layers.append({"layer": RE_COUNTER.sub("", k),
+                           "time": raws[0]["raw"][0] / 1000.0})
+    if wall is None:
+        return None
+    return ArmNNIteration(wall_ms=wall, layers=layers)
+
+def parse_armnn(lines):
+    p = ArmNNParser()
+    for line in lines:
+        p.feed(line)
+    return p.result()
@@ -0,0 +1,153 @@
+# Copyright (c) 2019, ARM Limited and Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Expands the workloads of the yaml into jobs and orders them. Any option
+# given as a list is swept: threads, options and fp16 on tflite, accelerator,
+# fp16, quantized and concurrent on armnn, threads on host, and the model
+# itself.
+
+import itertools
+import os
+
+# Armnn options that can be swept and the tag they add to the type
+ARMNN_SWEEP = ['accelerator', 'fp16', 'quantized', 'concurrent']
+
+def as_list(v):
+    if isinstance(v, list):
+        return v
+    return [v]
+
+def model_name(model):
+    return os.path.splitext(os.path.split(model)[-1])[0]
+
+def workload_name(work):
+    if 'name' in work.keys():
+        return work['name']
+    return os.path.split(as_list(work['model'])[0])[-1]
+
+def tag(key, value):
+    if isinstance(value, bool):
+        return key if value else "no" + key
+    return str(value)
+
+def tflite_jobs(conf, threads, options):
+    jobs = []
+    for T in as_list(conf.get('threads', threads)):
+        for W in as_list(conf.get('options', options)):
+            for F in as_list(conf.get('fp16', False)):
+                res = dict(conf, threads=T, options=W, fp16=F)
+                label = W + "_" + str(T) + "Threads"
+                if F:
+                    label = label + "_fp16"
+                jobs.append({"backend": "tflite", "threads": T, "option": W,
+                             "conf": res, "label": label,
+                             "params": {"threads": T, "option": W,
+                                        "fp16": F}})
+    return jobs
+
+def host_jobs(conf, threads):
+    jobs = []
+    for T in as_list(conf.get('threads', threads)):
+        jobs.append({"backend": "host", "threads": T, "option": "cpu",
+                     "conf": dict(conf, threads=T),
+                     "label": "host_" + str(T) + "Threads",
+                     "params": {"threads": T, "option": "cpu"}})
+    return jobs
+
+def armnn_jobs(conf):
+    swept = [k for k in ARMNN_SWEEP if isinstance(conf.get(k), list)]
+    jobs = []
+    for values in itertools.product(*[conf[k] for k in swept]):
+        res = dict(conf, **dict(zip(swept, values)))
+        label = "_".join(["ArmNN"] + [tag(k, v) for k, v in zip(swept, values)])
+        params = {k: res.get(k) for k in ARMNN_SWEEP}
+        jobs.append({"backend": "armnn", "threads": None, "option": None,
+                     "conf": res, "label": label, "params": params})
+    return jobs
+
+# A filter is a dict of params, a list value matches any of its items
+def matches(job, flt):
+    for k, v in flt.items():
+        if job['params'].get(k) not in as_list(v):
+            return False
+    return True
+
+def selected(job, include, exclude):
+    if len(include) > 0 and not any(matches(job, f) for f in include):
+        return False
+    return not any(matches(job, f) for f in exclude)
+
+def expand(work, threads, options, include=[], exclude=[]):
+    name = workload_name(work)
+    models = as_list(work['model'])
+    include = include + work.get('include', [])
+    exclude = exclude + work.get('exclude', [])
+    jobs = []
+    for model in models:
+        backend_jobs = []
+        if 'tflite' in work.keys():
+            backend_jobs += tflite_jobs(work['tflite'], threads, options)
+        if 'armnn' in work.keys():
+            backend_jobs += armnn_jobs(work['armnn'])
+        if 'host' in work.keys():
+            backend_jobs += host_jobs(work['host'] or {}, threads)
+        for job in backend_jobs:
+            job['work'] = work
+            job['model'] = model
+            job['name'] = name
+            if len(models) > 1:
+                job['name'] = name + "/" + model_name(model)
+            job['params'].update({"name": name, "model": model_name(model),
+                                  "backend": job['backend']})
+            if selected(job, include, exclude):
+                jobs.append(job)
+    return jobs
+
+# Every job of the config, grouped by model so each model is uploaded once
+# and the next one can be pushed while the current one runs
+def plan(data, threads, options):
+    glob = data.get('global', {}) or {}
+    include = glob.get('include', [])
+    exclude = glob.get('exclude', [])
+    jobs = []
+    for work in data['workloads']:
+        if 'model' not in work.keys():
+            print("Error: Model option not found")
+            continue
+        jobs += expand(work, threads, options, include, exclude)
+    first = {}
+    for job in jobs:
+        first.setdefault(job['model'], len(first))
+    return sorted(jobs, key=lambda j: first[j['model']])
+
+# Seconds the jobs will take from the job_time of previous runs, history is
+# {key: [seconds]}. Returns the estimate and how many jobs had history.
+def estimate(jobs, keys, history, devices=1):
+    known = []
+    for job, key in zip(jobs, keys):
+        if key in history:
+            known.append(sum(history[key]) / len(history[key]))
+    if len(known) == 0:
+        return None, 0
+    avg = sum(known) / len(known)
+    total = sum(known) + avg * (len(jobs) - len(known))
+    return total / devices, len(known)
@@ -0,0 +1,74 @@
+# Copyright (c) 2019, ARM Limited and Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Local store of job results. Every result is a JSON file named after the
+# hash of its key, which holds everything that can change the measurement:
+# model, benchmark binary, device and workload config.
+
+import hashlib
+import json
+import os
+import time
+
+STORE_PATH = "result_store"
+
+def key_hash(key):
+    st = json.dumps(key, sort_keys=True)
+    return hashlib.sha256(st.encode('utf-8')).hexdigest()
+
+def store_file(key):
+    return os.path.join(STORE_PATH, key_hash(key) + ".json")
+
+# Stored result for the key, None if there is none or it is older than
+# max_age seconds
+def load(key, max_age=None):
+    try:
+        with open(store_file(key), "r") as f:
+            rec = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if max_age is not None and time.time() - rec['time'] > max_age:
+        return None
+    return rec['result']
+
+def save(key, result):
+    os.makedirs(STORE_PATH, exist_ok=True)
+    path = store_file(key)
+    # Written aside and renamed so a crash never leaves half a file
+    tmp = path + "." + str(os.getpid()) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"key": key, "time": time.time(), "result": result}, f)
+    os.replace(tmp, path)
+
+# Every stored (key, result)
+def records():
+    if not os.path.isdir(STORE_PATH):
+        return
+    for fil in os.listdir(STORE_PATH):
+        if not fil.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(STORE_PATH, fil), "r") as f:
+                rec = json.load(f)
+        except (OSError, ValueError):
+            continue
+        yield rec['key'], rec['result']
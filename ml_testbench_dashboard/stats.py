@@ -0,0 +1,127 @@
+# Copyright (c) 2019, ARM Limited and Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Statistics over the raw latency samples and the adaptive benchmark loop.
+
+import math
+import statistics
+import time
+
+# Below this number of samples the confidence interval is not trusted
+MIN_CI_SAMPLES = 5
+
+def percentile(samples, p):
+    s = sorted(samples)
+    if len(s) == 0:
+        return None
+    k = (len(s) - 1) * p / 100.0
+    f = int(math.floor(k))
+    c = min(f + 1, len(s) - 1)
+    return s[f] + (s[c] - s[f]) * (k - f)
+
+# Distribution free confidence interval of the median using order statistics
+def median_ci(samples, confidence=0.95):
+    s = sorted(samples)
+    n = len(s)
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    lo = int(math.floor(n / 2.0 - z * math.sqrt(n) / 2.0))
+    hi = int(math.ceil(n / 2.0 + z * math.sqrt(n) / 2.0))
+    return s[max(lo, 0)], s[min(hi, n - 1)]
+
+# True when the half width of the interval is within target of the median
+def converged(samples, target, confidence=0.95):
+    if len(samples) < MIN_CI_SAMPLES:
+        return False
+    lo, hi = median_ci(samples, confidence)
+    med = percentile(samples, 50)
+    if med == 0:
+        return True
+    return (hi - lo) / 2.0 <= target * med
+
+# Two sided p-value of the Mann-Whitney U test that a and b come from the
+# same distribution, with the normal approximation and tie correction
+def mann_whitney(a, b):
+    n1 = len(a)
+    n2 = len(b)
+    if n1 == 0 or n2 == 0:
+        return None
+    pooled = sorted([(v, 0) for v in a] + [(v, 1) for v in b])
+    n = n1 + n2
+    rank_a = 0.0
+    ties = 0.0
+    i = 0
+    while i < n:
+        j = i
+        while j + 1 < n and pooled[j + 1][0] == pooled[i][0]:
+            j = j + 1
+        rank = (i + j) / 2.0 + 1
+        t = j - i + 1
+        ties = ties + t ** 3 - t
+        rank_a = rank_a + rank * sum(1 for k in range(i, j + 1)
+                                     if pooled[k][1] == 0)
+        i = j + 1
+    u = rank_a - n1 * (n1 + 1) / 2.0
+    var = n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1)))
+    if var <= 0:
+        return 1.0
+    z = (abs(u - n1 * n2 / 2.0) - 0.5) / math.sqrt(var)
+    return min(1.0, 2 * (1 - statistics.NormalDist().cdf(max(z, 0.0))))
+
+def summarize(samples, confidence=0.95):
+    if len(samples) == 0:
+        return {"count": 0}
+    lo, hi = median_ci(samples, confidence)
+    std = 0.0
+    if len(samples) > 1:
+        std = statistics.stdev(samples)
+    return {"p50": percentile(samples, 50),
+            "p90": percentile(samples, 90),
+            "p99": percentile(samples, 99),
+            "stddev": std,
+            "count": len(samples),
+            "median_ci": [lo, hi]}
+
+# Calls run_round, which returns (list of samples, round output) or None on
+# error, until the median is known within target or the time budget is
+# over. The first warmup rounds are discarded. A target of 0 runs exactly
+# min_samples samples. Returns the samples and the outputs of every round.
+def adaptive_run(run_round, warmup=1, min_samples=10, max_samples=100,
+                 target=0.02, budget=60.0, confidence=0.95):
+    samples = []
+    rounds = []
+    for _ in range(warmup):
+        if run_round() is None:
+            return samples, rounds
+    start = time.monotonic()
+    while len(samples) < max(max_samples, min_samples):
+        res = run_round()
+        if res is None:
+            break
+        samples.extend(res[0])
+        rounds.append(res[1])
+        if len(samples) < min_samples:
+            continue
+        if not target or converged(samples, target, confidence):
+            break
+        if time.monotonic() - start > budget:
+            break
+    return samples, rounds
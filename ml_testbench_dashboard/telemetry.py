@@ -0,0 +1,107 @@
+# Copyright (c) 2019, ARM Limited and Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Temperatures and CPU frequencies of the device. They are read through
+# their own adb shell session so they can be sampled while a benchmark keeps
+# the main session busy.
+
+import threading
+import time
+
+SNAPSHOT = ("for z in /sys/class/thermal/thermal_zone*; do "
+            "echo \"T $(cat $z/type) $(cat $z/temp)\"; done; "
+            "for c in /sys/devices/system/cpu/cpu[0-9]*; do "
+            "echo \"F ${c##*/} $(cat $c/cpufreq/scaling_cur_freq) "
+            "$(cat $c/cpufreq/scaling_max_freq) "
+            "$(cat $c/cpufreq/cpuinfo_max_freq)\"; done")
+
+# Temperatures in C by zone type and frequencies in kHz by core
+def snapshot(session):
+    r, o, e = session.run([SNAPSHOT])
+    snap = {"time": time.time(), "temps": {}, "cpus": {}}
+    for line in o.decode('utf-8', errors='replace').splitlines():
+        f = line.split()
+        try:
+            if len(f) == 3 and f[0] == "T":
+                temp = float(f[2])
+                # Most zones report millidegrees
+                if abs(temp) > 1000:
+                    temp = temp / 1000.0
+                snap["temps"][f[1]] = max(temp, snap["temps"].get(f[1], temp))
+            elif len(f) == 5 and f[0] == "F":
+                snap["cpus"][f[1]] = {"cur": int(f[2]), "max": int(f[3]),
+                                      "hw_max": int(f[4])}
+        except ValueError:
+            continue
+    return snap
+
+# Highest temperature of the zones whose type contains one of zones, or of
+# all of them when zones is empty
+def max_temp(snap, zones=[]):
+    temps = [t for z, t in snap["temps"].items()
+             if len(zones) == 0 or any(p in z for p in zones)]
+    if len(temps) == 0:
+        return None
+    return max(temps)
+
+# Waits until the device is below threshold, returns the seconds waited
+def cool_down(session, threshold, zones=[], max_wait=600, interval=1.0):
+    start = time.monotonic()
+    while True:
+        temp = max_temp(snapshot(session), zones)
+        waited = time.monotonic() - start
+        if temp is None or temp <= threshold:
+            return waited
+        if waited > max_wait:
+            print("Warning: device still at " + str(temp) + "C after "
+                  + str(int(waited)) + "s")
+            return waited
+        time.sleep(interval)
+
+# A core is throttled when its frequency is capped below the hardware max
+def throttled(snaps):
+    for snap in snaps:
+        for c in snap["cpus"].values():
+            if c["max"] < c["hw_max"]:
+                return True
+    return False
+
+# Takes snapshots every interval seconds in the background
+class Monitor:
+    def __init__(self, session, interval=1.0):
+        self.session = session
+        self.interval = interval
+        self.samples = []
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.loop)
+
+    def loop(self):
+        while not self.done.wait(self.interval):
+            self.samples.append(snapshot(self.session))
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.done.set()
+        self.thread.join()
+        return self.samples
@@ -0,0 +1,71 @@
+# Copyright (c) 2019, ARM Limited and Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Checks of the adb sessions against fake_adb.py, no device needed.
+# Usage: python3 -m unittest test_adb_session
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = tempfile.mkdtemp(prefix="fake_adb_")
+os.environ["ADB"] = os.path.join(HERE, "fake_adb.py")
+os.environ["FAKE_ADB_ROOT"] = ROOT
+
+import adb_session
+
+def tearDownModule():
+    shutil.rmtree(ROOT, ignore_errors=True)
+
+class AdbSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.session = adb_session.AdbSession("fake0")
+
+    def tearDown(self):
+        self.session.close()
+
+    def run_batch(self, comms, timeout=30):
+        # The session blocks while a command waits, so run it on a thread
+        # and fail instead of hanging the tests
+        res = []
+        t = threading.Thread(target=lambda: res.append(self.session.run_batch(comms)),
+                             daemon=True)
+        t.start()
+        t.join(timeout)
+        self.assertFalse(t.is_alive(), "run_batch did not return")
+        return res[0]
+
+    def test_batch(self):
+        out = self.run_batch([["echo", "one"], ["sh", "-c", "'echo two >&2; exit 3'"]])
+        self.assertEqual(out[0], (0, b"one\n", b""))
+        self.assertEqual(out[1], (3, b"", b"two\n"))
+
+    def test_stdin_readers_do_not_eat_the_next_commands(self):
+        out = self.run_batch([["cat"], ["echo", "after"]])
+        self.assertEqual(out[0], (0, b"", b""))
+        self.assertEqual(out[1], (0, b"after\n", b""))
+
+if __name__ == "__main__":
+    unittest.main()
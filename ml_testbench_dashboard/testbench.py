@@ -22,12 +22,27 @@
 # SOFTWARE.
 
 
-import csv
+from adb_session import ADB, AdbSession, get_session, set_device
+import argparse
+import compact
+import compare
+from dataclasses import asdict
+import hashlib
+import host_backend
 import json
+import journal
+import numpy as np
 import os
-from random import random
+import planner
+import queue
 import subprocess
 import sys
+import telemetry
+import threading
+import time
+from parsers import ArmNNParser, MemoryParser, TFLiteParser
+import result_store
+from stats import adaptive_run, summarize
 import yaml
 
 # Default values
@@ -36,178 +51,366 @@ BENCH_BIN_PATH = "/data/local/tmp/binaries/"
 TFLITE_BIN = "benchmark_model"
 ARMNN_BIN = "ExecuteNetwork"
 NUM_LOOPS = 10
+# Measured runs of every benchmark_model process
+NUM_RUNS = 10
 NUM_THREADS = [4]
 WHERE_EXEC = ['cpu']
+NUM_WARMUP = 1
+MAX_LOOPS = 100
+# Relative half width of the confidence interval of the median we aim for
+TARGET_CI = 0.02
+# Seconds spent sampling one configuration before giving up on TARGET_CI
+TIME_BUDGET = 60
+# Seconds between telemetry samples and maximum cool down wait
+TELEMETRY_INTERVAL = 1.0
+COOLDOWN_MAX_WAIT = 600
+# MB of binaries and models kept on the device between runs
+DEVICE_CACHE_MB = 2048
+# Seconds between reads of the memory of the benchmark process, done in an
+# extra round that is not measured
+MEM_POLL = 0.05
+MEM_FILE = "/data/local/tmp/mempoll"
 
+# Host folder with the generated ArmNN input tensors
+INPUT_CACHE = "input_cache"
+
+HASH_CACHE = {}
+MANIFESTS = {}
+FINGERPRINTS = {}
+INPUT_LOCK = threading.Lock()
+
+# Commands with shell=True go through the persistent adb shell session
 def execute_command(comm, shell=False):
     if shell:
-        comm = ["adb", "shell"] + comm
+        return get_session().run(comm)
     process = subprocess.run(
         comm, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False)
     return process.returncode, process.stdout, process.stderr
 
-# Uploads the file only if it does not exist
-def upload_if(localP, remoteP, executable=False):
-    r, o, e = execute_command(["ls", remoteP], shell=True)
-    if r==0:
-        return 0 #because the file exist
-    r, o, e = execute_command(["adb", "push", localP, remoteP])
-    if r!=0:
-        print("Error: Uploading file " + localP)
-        return 1
-    if not executable:
+# Sends several shell commands at once, returns a list of (ret, out, err)
+def execute_batch(comms):
+    return get_session().run_batch(comms)
+
+# Runs a shell command giving every line of its output to feed
+def execute_stream(comm, feed):
+    return get_session().run_stream(comm, feed)
+
+# Runs an adb command on the host (push, devices...) for the current device
+def execute_adb(comm):
+    return execute_command(get_session().adb_command(comm))
+
+# Hash of a local file, cached while the file does not change
+def local_hash(path):
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    if key not in HASH_CACHE:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        HASH_CACHE[key] = h.hexdigest()
+    return HASH_CACHE[key]
+
+# Reads the artifacts that are already on the device with one batch of
+# commands. Returns {remote path: {"sha256", "size", "used"}}, "used" is the
+# mtime which we touch every time an artifact is used.
+def read_manifest():
+    folders = [BENCH_BIN_PATH, MODEL_FOLDER]
+    (r, o, e), (rs, os_, es) = execute_batch([
+        ["find"] + folders + ["-type", "f", "-exec", "sha256sum", "{}", "+"],
+        ["find"] + folders + ["-type", "f", "-exec",
+                              "stat", "-c", "'%s %Y %n'", "{}", "+"]])
+    manifest = {}
+    for line in o.decode('utf-8').splitlines():
+        h = line.split(None, 1)
+        if len(h) == 2:
+            manifest[h[1].strip()] = {"sha256": h[0], "size": 0, "used": 0}
+    for line in os_.decode('utf-8').splitlines():
+        st = line.split(None, 2)
+        if len(st) == 3 and st[2] in manifest:
+            manifest[st[2]]["size"] = int(st[0])
+            manifest[st[2]]["used"] = int(st[1])
+    return manifest
+
+def get_manifest():
+    serial = get_session().serial
+    if serial not in MANIFESTS:
+        MANIFESTS[serial] = read_manifest()
+    return MANIFESTS[serial]
+
+# Pushes the (local, remote) files that are missing or changed on the device.
+# Files going to the same folder with the same name are sent in one adb push.
+def upload_files(files, executable=False):
+    if len(files) == 0:
         return 0
-    r, o, e = execute_command(["chmod", "u+x", remoteP], shell=True)
-    if r!=0:
+    manifest = get_manifest()
+    groups = {}
+    for localP, remoteP in files:
+        h = local_hash(localP)
+        if remoteP in manifest and manifest[remoteP]["sha256"] == h:
+            continue
+        if os.path.basename(localP) == os.path.basename(remoteP):
+            dest = os.path.dirname(remoteP) + "/"
+        else:
+            dest = remoteP
+        groups.setdefault(dest, []).append((localP, remoteP, h))
+    for dest, fils in groups.items():
+        r, o, e = execute_adb(["push"] + [f[0] for f in fils] + [dest])
+        if r!=0:
+            print("Error: Uploading file " + ", ".join(f[0] for f in fils))
+            return 1
+        for localP, remoteP, h in fils:
+            manifest[remoteP] = {
+                "sha256": h, "size": os.path.getsize(localP), "used": 0}
+    comms = [["touch", "-c"] + [f[1] for f in files]]
+    if executable:
+        comms.append(["chmod", "u+x"] + [f[1] for f in files])
+    res = execute_batch(comms)
+    now = int(time.time())
+    for localP, remoteP in files:
+        manifest[remoteP]["used"] = now
+    if executable and res[1][0]!=0:
         print("Error: Making it executable")
         return 1
     return 0
 
+# Uploads the file only if it is not on the device or it has changed
+def upload_if(localP, remoteP, executable=False):
+    return upload_files([(localP, remoteP)], executable=executable)
+
+# Removes the least recently used models until the artifacts on the device
+# fit in limit_mb. The binaries are only removed when the limit is 0.
+def evict_artifacts(limit_mb):
+    manifest = get_manifest()
+    total = sum(v["size"] for v in manifest.values())
+    limit = limit_mb * 1024 * 1024
+    victims = []
+    for path in sorted(manifest, key=lambda k: manifest[k]["used"]):
+        if total <= limit:
+            break
+        if limit_mb > 0 and not path.startswith(MODEL_FOLDER):
+            continue
+        victims.append(path)
+        total = total - manifest[path]["size"]
+    if len(victims) == 0:
+        return 0
+    print("Removing " + str(len(victims)) + " artifacts from the device")
+    r, o, e = execute_command(["rm", "-f"] + victims, shell=True)
+    for path in victims:
+        del manifest[path]
+    return r
+
 def upload_executable():
     print("Uploading TFLite executable...", end='', flush=True)
-    r, o, e = execute_command(["mkdir", "-p", BENCH_BIN_PATH], shell=True)
+    (r, o, e), (rm, om, em) = execute_batch([["mkdir", "-p", BENCH_BIN_PATH],
+                                             ["mkdir", "-p", MODEL_FOLDER]])
     if r!=0:
         print("Error: There was a problem with mkdir binaries folder")
         print(o, e)
         return 1
-    dirs = os.listdir("binaries")
-    for fil in dirs:
-        ret = upload_if(
-            os.path.join("binaries", fil), BENCH_BIN_PATH+fil, executable=True)
-        if ret!=0:
-            print("Error: There was a problem uploading "+fil)
-            return 1
-    r, o, e = execute_command(["mkdir", "-p", MODEL_FOLDER], shell=True)
-    if r!=0:
+    if rm!=0:
         print("Error: There was a problem with mkdir model folder")
         return 1
+    files = [(os.path.join("binaries", fil), BENCH_BIN_PATH + fil)
+             for fil in sorted(os.listdir("binaries"))]
+    ret = upload_files(files, executable=True)
+    if ret!=0:
+        print("Error: There was a problem uploading the binaries")
+        return 1
     print("Done")
     return 0
 
-# Execute the TFLite benchmark
-def bench_exec(file, where, thr, loops):
+# Runs the command in the background and reads the peak and current RSS of
+# its process from /proc until it exits. The last reading is printed after
+# the output of the command and the exit code is the one of the command.
+# The polling competes with the benchmark, so it is only used for a round
+# whose latency is not kept.
+def memory_polled(comm):
+    return [" ".join(comm) + " & p=$!; "
+            "while kill -0 $p 2>/dev/null; do "
+            "grep -E 'VmHWM|VmRSS' /proc/$p/status > " + MEM_FILE + ".t "
+            "2>/dev/null && mv " + MEM_FILE + ".t " + MEM_FILE + "; "
+            "sleep " + str(MEM_POLL) + "; done; "
+            "wait $p; r=$?; cat " + MEM_FILE + " 2>/dev/null; "
+            "rm -f " + MEM_FILE + " " + MEM_FILE + ".t; exit $r"]
+
+# Peak memory of the rounds of a job
+def memory_summary(mems):
+    out = {}
+    peaks = [m.peak_rss_kb for m in mems if m.peak_rss_kb is not None]
+    if len(peaks) > 0:
+        out["peak_rss_kb"] = max(peaks)
+    arena = {}
+    for m in mems:
+        arena.update(m.arena)
+    if len(arena) > 0:
+        out["arena"] = arena
+    return out
+
+# Execute the TFLite benchmark, the output is parsed while it is produced.
+# Returns the parsed output and the memory of the process, the peak RSS is
+# only read with poll_memory.
+def bench_exec(file, where, thr, loops, extra=[], poll_memory=False):
     opt = ""
     if where == "gpu":
         opt = "--use_gpu=true"
     elif where == "nnapi":
         opt = "--use_nnapi=true"
 
-    r, o, e = execute_command([BENCH_BIN_PATH + TFLITE_BIN,
-                              "--graph=" + MODEL_FOLDER + file,
-                              "--num_runs=" + str(loops),
-                              "--num_threads=" + str(thr),
-                              "--enable_op_profiling=true",
-                              opt], shell=True)
+    parser = TFLiteParser()
+    mem = MemoryParser(parser)
+    comm = [BENCH_BIN_PATH + TFLITE_BIN,
+            "--graph=" + MODEL_FOLDER + file,
+            "--num_runs=" + str(loops),
+            "--num_threads=" + str(thr),
+            "--enable_op_profiling=true",
+            opt] + extra
+    if poll_memory:
+        comm = memory_polled(comm)
+    r, o, e = execute_stream(comm, mem.feed)
     if r!=0:
         print("Error executing " + file + " on " +  where + " mode")
-        print(o)
         print(e)
         return None, None
-    return o, e
-
-# Parser for the TFLite output
-def parse(doc):
-    doc = doc.split('\n')
-    in_avg = False
-    fir = False
-    l_s = 0
-    l_e = 0
-    for i in range(len(doc)):
-        line = doc[i]
-        if len(line) == 0:
+    return parser.result(), mem.result()
+
+# Arguments of adaptive_run from the workload options, loops is the minimum
+# number of samples
+def engine_config(conf, loops):
+    return {"warmup": conf.get('warmup', NUM_WARMUP),
+            "min_samples": conf.get('loops', loops),
+            "max_samples": conf.get('max_loops', MAX_LOOPS),
+            "target": conf.get('target_ci', TARGET_CI),
+            "budget": conf.get('time_budget', TIME_BUDGET)}
+
+# Averages the per layer times of several rounds
+def merge_rounds(rounds):
+    times = [dict(t, time=0.0) for t in rounds[0]]
+    n = 0
+    for r in rounds:
+        if len(r) != len(times):
             continue
-        if "Average" == line[0:7]:
-            l_s = i + 2
-            in_avg = True
-        if line[0] == "=" and in_avg and fir:
-            l_e = i
-            in_avg = False
-        if line[0] == "=" and in_avg and not fir:
-            fir = True
-    table = doc[l_s + 1:l_e]
-    if len(table)==0:
-        print("\nError extracting results table")
-        return [], None
-    x = csv.reader(table, delimiter="\t")
-    li = []
+        for i in range(len(r)):
+            times[i]["time"] = times[i]["time"] + r[i]["time"]
+        n = n + 1
     mean_time = 0.0
-    for row in x:
-        if len(row) < 4:
-            continue
-        row = [x for x in row if x]
-        t = float(row[3].strip())
-        mean_time = mean_time + t
-        li.append({"layer":row[0].strip(), "time":t})
-    return li, mean_time
-
-# Parser for the ArmNN output
-def parse_results(inp):
-    st = ""
-    lines = inp.split('\n')
-    is_json = 0
-    for line in lines:
-        if len(line) == 0:
-            continue
-        if line[0] == '{':
-            is_json = is_json + 1
-        if is_json != 0:
-            st = st + line
-        if line[0] == '}':
-            is_json = is_json - 1
-    if st == "":
+    for t in times:
+        t["time"] = t["time"] / n
+        mean_time = mean_time + t["time"]
+    return times, mean_time
+
+# Adds the raw samples and their statistics to a result entry
+def add_stats(out, samples, conf):
+    out["samples"] = samples
+    out["warmup"] = conf['warmup']
+    out.update(summarize(samples))
+    return out
+
+# Runs one TFLite configuration, returns the result entry or None. Every
+# round is one process doing the warmup runs and then runs measured runs,
+# so the model load and the delegate init are paid once per round. The
+# benchmark only prints the statistics of the runs, every round gives one
+# sample with their mean.
+def run_tflite(model, W, T, work_config):
+    conf = engine_config(work_config, NUM_LOOPS)
+    warm = conf['warmup']
+    conf['warmup'] = 0
+    runs = work_config.get('runs', NUM_RUNS)
+    extra = ["--warmup_runs=" + str(warm), "--warmup_min_secs=0",
+             "--min_secs=0"]
+    if work_config.get('fp16', False):
+        extra.append("--allow_fp16=true")
+    # The interpreter state printed after the run has the arena sizes
+    if work_config.get('arena', False):
+        extra.append("--print_postinvoke_state=true")
+    def run_round():
+        res, mem = bench_exec(model, W, T, runs, extra)
+        if res is None:
+            return None
+        if len(res.ops) == 0 or res.steady is None:
+            print("\nError extracting results table")
+            return None
+        # A single run is printed as count=1 curr=X, without avg
+        ms = res.steady.curr / 1000.0
+        if res.steady.count != 1:
+            ms = res.steady.avg / 1000.0
+        if ms <= 0:
+            print("\nError: no latency in the output")
+            return None
+        return [ms], (res, mem)
+    samples, rounds = adaptive_run(run_round, **conf)
+    conf['warmup'] = warm
+    if len(rounds) == 0:
         return None
-    data = json.loads(st)
-    data = data["ArmNN"]
-    outd = {}
-    k = list(data.keys())
-    if len(k) > 1:
-        print("There is more than 1 run")
-    data = data[k[0]]
-    if not "Execute_#2" in data:
-        print("Execution not found")
+    mems = [mem for res, mem in rounds]
+    if work_config.get('memory', True):
+        res, mem = bench_exec(model, W, T, 1, extra, poll_memory=True)
+        if mem is not None:
+            mems.append(mem)
+    li, m_t = merge_rounds([res.layer_times() for res, mem in rounds])
+    out = {'type':W + "_" + str(T) + "Threads", "mean_time": m_t,
+           "times": li, "threads": T}
+    # The other tables are taken from the last round
+    last = rounds[-1][0]
+    out["init_time"] = last.init_ms
+    if last.warmup is not None:
+        out["first_time"] = last.warmup.first / 1000.0
+    out["node_types"] = [asdict(n) for n in last.node_types]
+    out["memory"] = memory_summary(mems)
+    if "peak" in last.memory:
+        out["memory"]["footprint_mb"] = last.memory["peak"]
+    return add_stats(out, samples, conf)
+
+# Runs one configuration on the host. Every round is one inference of the
+# same interpreter, the per layer times come from a separate profiling run.
+def run_host(model, T, work_config):
+    conf = engine_config(work_config, NUM_LOOPS)
+    base = host_backend.reset_peak_rss()
+    interp, init_ms = host_backend.load(model, T)
+    if interp is None:
         return None
-    data = data["Execute_#2"]
-    outd["type"] = "ArmNN"
-    outd["mean_time"] = data["Wall clock time_#2"]["raw"][0] / 1000.0
-    outd["times"] = []
-
-    keys = list(data.keys())
-    for k in keys[4:]:
-        ent = data[k]
-        ks = list(ent.keys())
-        outd["times"].append(
-            {"layer": k, "time": ent[ks[1]]["raw"][0] / 1000.0})
-
-    return outd
-
-def execute_tflite(work_config, model):
-    TH = NUM_THREADS
-    WH = WHERE_EXEC
-    LP = NUM_LOOPS
-    out = []
-    model = os.path.split(model)[-1]
-    if 'threads' in work_config.keys():
-        TH = work_config['threads']
-    if 'options' in work_config.keys():
-        WH = work_config['options']
-    if 'loops' in work_config.keys():
-        LP = work_config['loops']
-    for T in TH:
-        for W in WH:
-            ret, err = bench_exec(model, W, T, LP)
-            if ret is not None:
-                ret = ret.decode('ASCII')
-                li, m_t = parse(ret)
-                if len(li) == 0:
-                    print("Error")
-                    continue
-                out.append(
-                    {'type':W + "_" + str(T) + "Threads", "mean_time": m_t,
-                    "times": li, "threads": T})
-    return out
+    def run_round():
+        ms = host_backend.invoke(interp)
+        return [ms], ms
+    samples, rounds = adaptive_run(run_round, **conf)
+    if len(samples) == 0:
+        return None
+    times = host_backend.profile_ops(model, T, conf['min_samples'])
+    if times is None:
+        times = []
+    out = {"type": "host_" + str(T) + "Threads",
+           "mean_time": sum(samples) / len(samples), "times": times,
+           "threads": T, "init_time": init_ms}
+    # The testbench shares the process, its RSS before loading the model is
+    # kept to tell them apart
+    out["memory"] = host_backend.read_rss()
+    out["memory"]["base_rss_kb"] = base
+    return add_stats(out, samples, conf)
+
+# Random input tensor in the text format that ExecuteNetwork reads. It is
+# generated once per shape and type, so the host file and its hash do not
+# change and the manifest keeps it from being pushed again.
+def input_file(shape, dtype):
+    name = "input_" + dtype + "_" + "x".join(str(s) for s in shape) + ".txt"
+    path = os.path.join(INPUT_CACHE, name)
+    with INPUT_LOCK:
+        if not os.path.isfile(path):
+            os.makedirs(INPUT_CACHE, exist_ok=True)
+            rng = np.random.default_rng(0)
+            if dtype == "float":
+                data = rng.random(shape, dtype=np.float32)
+                fmt = "%.6f"
+            else:
+                data = rng.integers(0, 256, size=shape, dtype=np.int32)
+                fmt = "%d"
+            with open(path + ".tmp", "w") as f:
+                data.reshape(-1).tofile(f, sep="\n", format=fmt)
+                f.write("\n")
+            os.replace(path + ".tmp", path)
+    return path, name
 
 def execute_armnn(conf, model):
-    LP = 1
+    LP = NUM_LOOPS
     shap = []
     inName = ""
     outName = ""
@@ -215,6 +418,8 @@ def execute_armnn(conf, model):
     quant = " "
     turbo = " "
     acc = " "
+    intype = " "
+    dtype = "float"
     model = os.path.split(model)[-1]
     # Handle options
     if 'input_shape' not in conf.keys():
@@ -242,120 +447,454 @@ def execute_armnn(conf, model):
             acc = "-c GpuAcc"
         if 'Cpu' == conf['accelerator']:
             acc = "-c CpuAcc"
-    with open("temp_input_file","w") as f:
-        t = 1
-        for s in shap:
-            t = t * s
-        for i in range(t):
-            f.write(str(random()) + "\n")
-    upload_if("temp_input_file", MODEL_FOLDER + "intemp")
-    out = None
-    for i in range(LP):
-        r, o, e = execute_command(["export LD_LIBRARY_PATH=" + BENCH_BIN_PATH,
-                                  "&&",
-                                  BENCH_BIN_PATH + ARMNN_BIN,
-                                  concurrent,
-                                  quant,
-                                  turbo,
-                                  "-e",
-                                  "-f tflite-binary",
-                                  "-m " + MODEL_FOLDER + model,
-                                  "-i " + inName,
-                                  "-o " + outName,
-                                  acc,
-                                  "-c CpuRef",
-                                  "-d " + MODEL_FOLDER + "intemp"],
-                                  shell = True)
+    if 'input_type' in conf.keys():
+        dtype = conf['input_type']
+        intype = "-y " + dtype
+    localP, name = input_file(shap, dtype)
+    if upload_if(localP, MODEL_FOLDER + name) != 0:
+        return None
+    # Each round is one process running the warmup and LP iterations, the
+    # warmup iterations are dropped
+    eng = engine_config(conf, LP)
+    warm = eng['warmup']
+    eng['warmup'] = 0
+    def armnn_round(poll_memory):
+        parser = ArmNNParser()
+        mem = MemoryParser(parser)
+        comm = ["LD_LIBRARY_PATH=" + BENCH_BIN_PATH,
+                BENCH_BIN_PATH + ARMNN_BIN,
+                concurrent,
+                quant,
+                turbo,
+                "-e",
+                "-f tflite-binary",
+                "-m " + MODEL_FOLDER + model,
+                "-i " + inName,
+                "-o " + outName,
+                intype,
+                acc,
+                "-c CpuRef",
+                "-d " + MODEL_FOLDER + name,
+                "--iterations " + str(warm + LP)]
+        if poll_memory:
+            comm = memory_polled(comm)
+        r, o, e = execute_stream(comm, mem.feed)
         if r != 0:
             print("Error: Executing armnn")
-            print(o)
             print(e)
-            break
-        o = o.decode('ascii')
-        o = parse_results(o)
-        if o == None:
+            return None
+        o = parser.result()
+        if o == None or len(o) <= warm:
             print("Error: Parsing ArmNN")
-            break
-        if out == None:
-            out = o
-        else:
-            out['mean_time'] = out['mean_time']+o['mean_time']
-            for i in range(len(out['times'])):
-                out['times'][i]['time'] = (out['times'][i]['time']
-                                           + o['times'][i]['time'])
-    if out != None:
-        out['mean_time'] = out['mean_time'] / LP
-        for i in range(len(out['times'])):
-            out['times'][i]['time'] = out['times'][i]['time'] / LP
-    r, o, e = execute_command(["rm",MODEL_FOLDER+"intemp"], shell = True)
+            return None
+        o = o[warm:]
+        return ([it.wall_ms for it in o],
+                ([it.layer_times() for it in o], mem.result()))
+    samples, rounds = adaptive_run(lambda: armnn_round(False), **eng)
+    eng['warmup'] = warm
+    if len(rounds) == 0:
+        return None
+    mems = [mem for r, mem in rounds]
+    if conf.get('memory', True):
+        res = armnn_round(True)
+        if res is not None:
+            mems.append(res[1][1])
+    # The ArmNN mean time is the wall clock of the whole execution
+    times, m_t = merge_rounds([it for r, mem in rounds for it in r])
+    out = {"type": "ArmNN", "mean_time": sum(samples) / len(samples),
+           "times": times}
+    out["memory"] = memory_summary(mems)
+    load = rounds[-1][1].load_ms
+    if "initialization" in load:
+        out["init_time"] = load["initialization"]
+    if "optimization" in load:
+        out["optimization_time"] = load["optimization"]
+    return add_stats(out, samples, eng)
+
+# Serials of the devices attached and ready
+def list_devices():
+    r, o, e = execute_command([ADB, "devices"])
+    if r != 0:
+        print("Error: Listing devices")
+        return []
+    devices = []
+    for line in o.decode('utf-8').splitlines()[1:]:
+        fields = line.split()
+        if len(fields) == 2 and fields[1] == "device":
+            devices.append(fields[0])
+    return devices
+
+def describe_job(job):
+    return job['name'] + " with " + job['backend'] + " " + job['label']
+
+# Runs one job on the device of the current thread, host jobs run here
+def run_job(job):
+    if job['backend'] == "host":
+        out = run_host(job['model'], job['threads'], job['conf'])
+        if out is not None:
+            out['type'] = job['label']
+        return out
+    model = os.path.split(job['model'])[-1]
+    if upload_if(job['model'], MODEL_FOLDER + model) != 0:
+        return None
+    if job['backend'] == "tflite":
+        out = run_tflite(model, job['option'], job['threads'], job['conf'])
+    else:
+        out = execute_armnn(job['conf'], job['model'])
+    if out is not None:
+        out['type'] = job['label']
+    return out
+
+# Identity of a job in the journal, with replicate it includes the serial
+def job_id(job, serial=None):
+    ident = [job['name'], job['label']]
+    if serial is not None:
+        ident.append(serial)
+    return json.dumps(ident)
+
+# Queue with the device jobs, or the host ones, that are not done yet
+def job_queue(jobs, done, serial=None, host=False):
+    q = queue.Queue()
+    for i, job in enumerate(jobs):
+        if (job['backend'] == "host") != host:
+            continue
+        if job_id(job, serial) not in done:
+            q.put((i, job))
+    return q
+
+# Build fingerprint, SoC and CPU governors of the current device
+def device_fingerprint():
+    serial = get_session().serial
+    if serial not in FINGERPRINTS:
+        res = execute_batch([
+            ["getprop", "ro.build.fingerprint"],
+            ["getprop", "ro.board.platform"],
+            ["getprop", "ro.hardware"],
+            ["cat", "/sys/devices/system/cpu/cpu*/cpufreq/scaling_governor"]])
+        out = [o.decode('utf-8', errors='replace').strip() for r, o, e in res]
+        FINGERPRINTS[serial] = {"build": out[0], "soc": out[1],
+                                "hardware": out[2],
+                                "governor": sorted(set(out[3].split()))}
+    return FINGERPRINTS[serial]
+
+# Hash of the binaries used by the backend
+def binary_hash(backend):
+    if backend == "host":
+        h = hashlib.sha256(str(host_backend.runtime()[1]).encode('utf-8'))
+        if os.path.isfile(host_backend.HOST_BENCH_BIN):
+            h.update(local_hash(host_backend.HOST_BENCH_BIN).encode('ascii'))
+        return h.hexdigest()
+    if backend == "tflite":
+        fils = [TFLITE_BIN]
+    else:
+        fils = [ARMNN_BIN] + [f for f in os.listdir("binaries")
+                              if f.endswith(".so")]
+    h = hashlib.sha256()
+    for fil in sorted(fils):
+        h.update(local_hash(os.path.join("binaries", fil)).encode('ascii'))
+    return h.hexdigest()
+
+# Part of the key of the job in the result store that does not depend on
+# the device
+def static_key(job):
+    conf = dict(job['conf'])
+    conf.pop('threads', None)
+    conf.pop('options', None)
+    return {"model": local_hash(job['model']),
+            "binary": binary_hash(job['backend']),
+            "backend": job['backend'],
+            "threads": job['threads'],
+            "option": job['option'],
+            "config": conf}
+
+# Key of the job in the result store. With replicate the serial is part of
+# it because we want one measurement per device.
+def job_key(job, replicate):
+    key = static_key(job)
+    key["device"] = device_fingerprint()
+    if replicate:
+        key["serial"] = get_session().serial
+    return key
+
+# Seconds taken by the stored jobs, by the hash of their static key
+def job_history():
+    history = {}
+    for key, res in result_store.records():
+        if 'job_time' not in res:
+            continue
+        key = dict(key)
+        key.pop("device", None)
+        key.pop("serial", None)
+        history.setdefault(result_store.key_hash(key), []).append(
+            res['job_time'])
+    return history
+
+# Pushes a model in the background while the device runs another job
+def prefetch(serial, model):
+    set_device(serial)
+    upload_if(model, MODEL_FOLDER + os.path.split(model)[-1])
+
+# Next job in the queue without taking it
+def peek(jobs):
+    with jobs.mutex:
+        if len(jobs.queue) > 0:
+            return jobs.queue[0][1]
+    return None
+
+# Runs the job between temperature and frequency snapshots of the device,
+# after waiting for it to cool down when thermal has a cooldown_temp
+def run_measured(job, mon, thermal):
+    zones = thermal.get('zones', [])
+    interval = thermal.get('interval', TELEMETRY_INTERVAL)
+    wait = 0.0
+    if thermal.get('cooldown_temp') is not None:
+        wait = telemetry.cool_down(mon, thermal['cooldown_temp'], zones,
+                                   thermal.get('max_wait', COOLDOWN_MAX_WAIT),
+                                   interval)
+    before = telemetry.snapshot(mon)
+    monitor = telemetry.Monitor(mon, interval)
+    monitor.start()
+    start = time.monotonic()
+    out = run_job(job)
+    job_time = time.monotonic() - start
+    during = monitor.stop()
+    after = telemetry.snapshot(mon)
+    if out is None:
+        return None
+    out['job_time'] = job_time
+    out['telemetry'] = {"before": before, "during": during, "after": after,
+                        "cooldown_wait": wait}
+    out['throttled'] = telemetry.throttled([before] + during + [after])
+    if out['throttled'] and thermal.get('drop_throttled', False):
+        print("Dropping throttled result of " + describe_job(job))
+        return None
     return out
 
-def loop_workloads(data):
+# Reuses the stored result of the job or runs it, then records the result
+# tagged with the serial. Jobs already in the result store are reused unless
+# opts['force'] is set. A reused result may come from another device with the
+# same fingerprint, it is reported under this serial and 'measured_on' keeps
+# the device that ran it.
+def finish_job(i, job, key, serial, results, opts, run, replicate=False):
+    out = None
+    if not opts['force']:
+        out = result_store.load(key, opts['max_age'])
+    if out is not None:
+        print("\t[" + str(serial) + "] Reusing stored result of "
+              + describe_job(job))
+        out['measured_on'] = out.get('measured_on', out.get('device'))
+        out['device'] = serial
+    else:
+        print("\t[" + str(serial) + "] Running workload "
+              + describe_job(job))
+        out = run()
+        if out is not None:
+            out['device'] = serial
+            result_store.save(key, out)
+    if out is not None:
+        results.append((i, serial, out))
+        ident = job_id(job, serial if replicate else None)
+        opts['journal'].append({"job": ident, "serial": serial,
+                                "result": out})
+
+# Runs the host jobs one after the other in this process
+def host_worker(jobs, results, opts):
+    while not opts['stop'].is_set():
+        try:
+            i, job = jobs.get_nowait()
+        except queue.Empty:
+            break
+        key = static_key(job)
+        key["device"] = host_backend.fingerprint()
+        def run():
+            start = time.monotonic()
+            out = run_job(job)
+            if out is not None:
+                out['job_time'] = time.monotonic() - start
+            return out
+        finish_job(i, job, key, "host", results, opts, run)
+
+# Takes jobs from the queue until it is empty or opts['stop'] is set, every
+# result is tagged with the serial of the device.
+def device_worker(serial, jobs, results, opts):
+    set_device(serial)
+    r = upload_executable()
+    if r != 0:
+        print("Error: Preparing device " + str(serial))
+        return
+    # Second session for the telemetry, the main one is busy during the runs
+    mon = AdbSession(serial)
+    pushing = {}
+    while not opts['stop'].is_set():
+        try:
+            i, job = jobs.get_nowait()
+        except queue.Empty:
+            break
+        if job['model'] in pushing:
+            pushing.pop(job['model']).join()
+        nxt = peek(jobs)
+        if (opts['prefetch'] and nxt is not None
+                and nxt['model'] != job['model']
+                and nxt['model'] not in pushing):
+            t = threading.Thread(target=prefetch, args=(serial, nxt['model']))
+            t.start()
+            pushing[nxt['model']] = t
+        def run():
+            return run_measured(job, mon, opts['thermal'])
+        finish_job(i, job, job_key(job, opts['replicate']), serial, results,
+                   opts, run, opts['replicate'])
+    for t in pushing.values():
+        t.join()
+    mon.close()
+    evict_artifacts(opts['limit'])
+
+# Runs the jobs on all the devices at the same time. With replicate every
+# device runs every job, otherwise the jobs are shared between the devices.
+# force ignores the result store, max_age (in seconds) ignores the results
+# older than it. Every finished job goes to the journal, the jobs found in
+# the resumed journal records are not run again. On Ctrl-C the workers stop
+# after their running job and KeyboardInterrupt is raised again.
+def loop_workloads(data, jour, resumed=[], force=False, max_age=None):
     if 'workloads' not in data.keys():
         print("Error: Parsing yaml")
         return 1
-    r = upload_executable()
-    if r != 0:
+    glob = {}
+    if 'global' in data.keys():
+        glob = data['global']
+    limit = glob.get('device_cache_mb', DEVICE_CACHE_MB)
+    replicate = glob.get('replicate', False)
+    jobs = planner.plan(data, NUM_THREADS, WHERE_EXEC)
+    # Only host jobs do not need adb at all
+    devices = []
+    if any(job['backend'] != "host" for job in jobs):
+        devices = glob.get('devices', list_devices())
+        if len(devices) == 0:
+            # Let adb pick the device
+            devices = [None]
+        print("Running on " + str(len(devices)) + " devices")
+
+    keys = [result_store.key_hash(static_key(job)) for job in jobs]
+    total, known = planner.estimate(jobs, keys, job_history(),
+                                    1 if replicate or len(devices) == 0
+                                    else len(devices))
+    if total is None:
+        print("Planned " + str(len(jobs)) + " jobs, no previous results")
+    else:
+        print("Planned " + str(len(jobs)) + " jobs, estimated "
+              + str(int(total)) + "s (" + str(known)
+              + " jobs with history)")
+    ids = {}
+    for i, job in enumerate(jobs):
+        ids[job_id(job)] = i
+        for d in devices:
+            ids[job_id(job, d)] = i
+    results = []
+    done = set()
+    for rec in resumed:
+        if rec['job'] in ids:
+            done.add(rec['job'])
+            results.append((ids[rec['job']], rec['serial'], rec['result']))
+    if len(done) > 0:
+        print("Resuming, " + str(len(done)) + " jobs already done")
+    shared = job_queue(jobs, done)
+    queues = [job_queue(jobs, done, d) if replicate else shared
+              for d in devices]
+
+    opts = {"limit": limit, "replicate": replicate, "force": force,
+            "max_age": max_age, "journal": jour,
+            "thermal": glob.get('thermal', {}),
+            "prefetch": glob.get('prefetch', True),
+            "stop": threading.Event()}
+    # The main thread waits on events, a join cut by Ctrl-C can leave the
+    # thread looking finished while it still runs
+    finished = []
+    def work(serial, q, ev):
+        try:
+            device_worker(serial, q, results, opts)
+        finally:
+            ev.set()
+    try:
+        # The host jobs go first so the device workers do not disturb them
+        host_worker(job_queue(jobs, done, host=True), results, opts)
+        for d, q in zip(devices, queues):
+            ev = threading.Event()
+            # Daemons, so a second Ctrl-C does not wait for the running jobs
+            threading.Thread(target=work, args=(d, q, ev), daemon=True).start()
+            finished.append(ev)
+        for ev in finished:
+            ev.wait()
+    except KeyboardInterrupt:
+        print("Stopping after the running jobs, Ctrl-C again to quit now")
+        opts['stop'].set()
+        for ev in finished:
+            ev.wait()
+        raise
+    if len(results) == 0 and len(jobs) > 0:
         return 1
+
     dic = {}
-    for work in data['workloads']:
-        if 'model' not in work.keys():
-            print("Error: Model option not found")
-            continue
-        name = os.path.split(work['model'])[-1]
-        if 'name' in work.keys():
-            print("\tRunning workload " + work['name'])
-        else:
-            print("\tRunning workload " + name)
-        upload_if(
-            os.path.join(
-                *list(os.path.split(work['model']))),
-            MODEL_FOLDER + name)
-        res = []
-
-        if 'tflite' in work.keys():
-            print("\t\tExecuting with tflite")
-            out = execute_tflite(work['tflite'], work['model'])
-            res.extend(out)
-        
-        if 'armnn' in work.keys():
-            print("\t\tExecuting with armnn")
-            out = execute_armnn(work['armnn'], work['model'])
-            if out != None:
-                res.append(out)
-
-        if 'name' in work.keys():
-            name = work['name']
-        dic[name] = res
-    r, o, e = execute_command(["rm", "-r", BENCH_BIN_PATH], shell = True)
-    r, o, e = execute_command(["rm", "-r", MODEL_FOLDER], shell = True)
+    for job in jobs:
+        dic[job['name']] = []
+    order = {d: i for i, d in enumerate(devices)}
+    results.sort(key=lambda x: (x[0], order.get(x[1], len(order))))
+    for i, serial, out in results:
+        dic[jobs[i]['name']].append(out)
     return dic
 
-def main(args):
-    if len(args) < 2:
-        print("Error: Argument error")
-        print("Usage:\n./testbench.py [yaml file with the config] | -h")
-        sys.exit(128)
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(description="ML testbench")
+    parser.add_argument('config', help="yaml file with the config")
+    parser.add_argument('--force', action='store_true',
+                        help="Run every job even if its result is stored")
+    parser.add_argument('--max-age', type=float,
+                        help="Hours after which a stored result is run again")
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip the jobs already in the journal")
+    return parser.parse_args(args[1:])
 
-    if args[1] == '-h':
-        print("Usage:\n./testbench.py [yaml file with the config] | -h")
-        return
-    
-    if not os.path.isfile(args[1]):
+def main(args):
+    if len(args) > 1 and args[1] == "compare":
+        sys.exit(compare.main(args[2:]))
+    args = parse_arguments(args)
+    if not os.path.isfile(args.config):
         print("Error: File not found")
         sys.exit(128)
 
-    with open(args[1], 'r') as f:
+    max_age = None
+    if args.max_age is not None:
+        max_age = args.max_age * 3600
+    with open(args.config, 'r') as f:
         data = yaml.load(f, Loader=yaml.FullLoader)
-        out = loop_workloads(data)
-        outfile = "results.json"
-        if 'global' in data.keys():
-            if 'outputfile' in data['global'].keys():
-                outfile = data['global']['outputfile']
-        print("Writting output file...", end='', flush=True)
-        with open(outfile, "w") as f:
-            json.dump(out, f)
-            print("Done")
+    outfile = "results.json"
+    outformat = "json"
+    if 'global' in data.keys():
+        if 'outputfile' in data['global'].keys():
+            outfile = data['global']['outputfile']
+        outformat = data['global'].get('outputformat', outformat)
+    # Every finished job is in the journal, it becomes the output file at
+    # the end
+    path = journal.journal_path(outfile)
+    resumed = []
+    if args.resume:
+        resumed = journal.load(path)
+    jour = journal.Journal(path, resume=args.resume)
+    try:
+        out = loop_workloads(data, jour, resumed, force=args.force,
+                             max_age=max_age)
+    except KeyboardInterrupt:
+        print("Interrupted, the finished jobs are in " + path
+              + ", run again with --resume")
+        sys.exit(130)
+    finally:
+        jour.close()
+    print("Writting output file...", end='', flush=True)
+    if outformat == "compact" and out != 1:
+        compact.write(outfile, out)
+    else:
+        journal.write_json(outfile, out)
+    if out != 1:
+        os.remove(path)
+    print("Done")
 
 if __name__ == "__main__":
-    main(sys.argv)
\ No newline at end of file
+    main(sys.argv)